@@ -0,0 +1,58 @@
+# Simulación multiagentes de un cruce con 4 semáforos, usable como librería.
+# Cada nombre se importa de su módulo la primera vez que se pide, así que
+# importar el paquete no carga Mesa, matplotlib ni pandas ni corre nada
+
+import importlib
+
+# Módulo donde vive cada nombre público del paquete
+_EXPORTS = {
+  "TERRAIN_CODES": "collector", "LIGHT_CODES": "collector",
+  "get_dynamic_cells": "collector", "get_grid": "collector",
+  "GridCollector": "collector",
+  "Car": "agents", "Stoplight": "agents",
+  "DIRECTIONS": "engine", "TURNS": "engine", "ACTIONS": "engine",
+  "LIGHT_STATES": "engine", "CarArrays": "engine",
+  "Demand": "arrivals", "PoissonDemand": "arrivals",
+  "TimeVaryingDemand": "arrivals", "TraceDemand": "arrivals",
+  "peak_demand": "arrivals", "load_trace": "arrivals",
+  "ArrivalSchedule": "arrivals",
+  "CrossroadGeometry": "geometry", "get_geometry": "geometry",
+  "SparseGrid": "geometry",
+  "ActiveSetActivation": "scheduler",
+  "RunningStat": "kpis", "TrafficKPIs": "kpis",
+  "CrossroadModel": "model", "restore_model": "model",
+  "save_checkpoint": "model", "load_checkpoint": "model",
+  "CityModel": "city", "CityShard": "city",
+  "CrossroadVecEnv": "env", "CrossroadEnvGroup": "env",
+  "FrameEncoder": "frames", "decode_frame": "frames",
+  "TrajectoryRecorder": "trajectory", "TrajectoryLog": "trajectory",
+  "EventRecorder": "events", "EventLog": "events", "scan_events": "events",
+  "HEATMAP_LAYERS": "heatmap", "CellHeatmap": "heatmap",
+  "LatencyHistogram": "metrics", "Metrics": "metrics",
+  "build_frame": "server", "FrameProducer": "server",
+  "SimulationServer": "server", "ReplayServer": "server",
+  "attach_model": "server", "attach_log": "server", "run": "server",
+  "attach_sessions": "server",
+  "Session": "sessions", "SessionPool": "sessions",
+  "show_statistics": "server",
+  "run_headless": "headless", "parameter_sweep": "headless",
+  "run_benchmarks": "bench",
+  "LoadClient": "loadtest", "run_load_test": "loadtest",
+  "load_test_local": "loadtest",
+  "animate_simulation": "render", "rasterize_grid": "render",
+  "render_simulation": "render",
+}
+
+__all__ = list(_EXPORTS)
+
+# Importa el módulo del nombre pedido y lo deja en el paquete
+def __getattr__(name):
+  if name not in _EXPORTS:
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+  value = getattr(importlib.import_module("." + _EXPORTS[name], __name__), name)
+  globals()[name] = value
+  return value
+
+# Lista también los nombres que aún no se han importado
+def __dir__():
+  return sorted(set(globals()) | set(__all__))
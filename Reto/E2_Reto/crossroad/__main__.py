@@ -0,0 +1,181 @@
+# Interfaz de línea de comandos del paquete:
+#   python -m crossroad serve      Simula y sirve el cruce a Unity
+#   python -m crossroad headless   Corre sin servidor e imprime las métricas
+#   python -m crossroad replay     Sirve a Unity un log grabado
+#   python -m crossroad render     Escribe un log grabado a video o GIF
+#   python -m crossroad loadtest   Prueba al servidor con muchos clientes
+# Cada subcomando importa solo los módulos que necesita
+
+import argparse
+import json
+import sys
+
+# Parámetros del modelo compartidos por los subcomandos que simulan, con los
+# mismos valores por defecto del flujo principal de RetoLocal.py
+def add_model_arguments(parser):
+  parser.add_argument("--M", type = int, default = 16)
+  parser.add_argument("--N", type = int, default = 16)
+  parser.add_argument("--spawn-rate", type = float, default = 0.15)
+  parser.add_argument("--light-tick", type = int, default = 8)
+  parser.add_argument("--smart", action = argparse.BooleanOptionalAction,
+                      default = True)
+  parser.add_argument("--engine", choices = ["agents", "arrays"],
+                      default = "agents")
+  parser.add_argument("--seed", type = int, default = None)
+
+# Simula el cruce en un servidor para Unity, opcionalmente grabándolo
+def serve(args):
+  from http.server import ThreadingHTTPServer
+  from .server import (SimulationServer, attach_model, attach_sessions, run,
+                       show_statistics)
+
+  model_params = [args.M, args.N, args.spawn_rate, args.light_tick,
+                  args.smart, args.max_duration]
+  attach_model(SimulationServer, model_params, args.buffer, args.metrics,
+               args.max_steps, COLLECT_FRAMES = args.animate, ENGINE = args.engine,
+               RECORD_PATH = args.record, EVENTS_PATH = args.events,
+               seed = args.seed)
+  if args.sessions is not None:
+    attach_sessions(SimulationServer, model_params, args.sessions,
+                    args.max_sessions, args.idle_timeout, args.max_steps,
+                    ENGINE = args.engine)
+  run(ThreadingHTTPServer, SimulationServer, port = args.port, log = args.log)
+  show_statistics(SimulationServer)
+  if SimulationServer.model.recorder is not None:
+    SimulationServer.model.recorder.close()
+  if SimulationServer.model.event_recorder is not None:
+    SimulationServer.model.event_recorder.close()
+  if args.animate:
+    from .render import animate_simulation
+    animate_simulation(SimulationServer.model)
+
+# Corre sin servidor la cantidad de steps dada e imprime las métricas
+def headless(args):
+  from .headless import run_headless
+
+  model_params = [args.M, args.N, args.spawn_rate, args.light_tick, args.smart]
+  result = run_headless(model_params, args.steps, args.seed, args.engine,
+                        args.checkpoint, args.checkpoint_every,
+                        fast_forward = args.fast_forward,
+                        events_path = args.events, heatmap_path = args.heatmap,
+                        heatmap_window = args.heatmap_window)
+  print(json.dumps(result, indent = 2))
+
+# Sirve a Unity un log grabado con el servidor de repetición
+def replay(args):
+  from http.server import ThreadingHTTPServer
+  from .server import ReplayServer, attach_log, run
+
+  attach_log(ReplayServer, args.path, args.speed)
+  run(ThreadingHTTPServer, ReplayServer, port = args.port, log = args.log)
+
+# Escribe un log grabado a un video o GIF
+def render(args):
+  from .render import render_simulation
+  from .trajectory import TrajectoryLog
+
+  frames = render_simulation(TrajectoryLog(args.path), args.output, args.fps,
+                             args.stride, args.downscale, args.processes,
+                             args.batch_size, args.cell_size)
+  print(f"{frames} cuadros escritos en {args.output}")
+
+# Prueba de carga contra un servidor ya levantado con --port, o contra uno
+# local con los parámetros del modelo. Termina con error si hubo errores,
+# requests trabados o el servidor no se apagó a tiempo
+def loadtest(args):
+  from .loadtest import load_test_local, run_load_test
+
+  options = {"clients": args.clients, "duration": args.duration,
+             "requests_per_second": args.rate, "request": args.request,
+             "steps": args.steps, "timeout": args.timeout,
+             "stall_seconds": args.stall_seconds, "processes": args.processes}
+  if args.port is not None:
+    report = run_load_test(args.port, args.host, sessions = args.sessions,
+                           **options)
+  else:
+    model_params = [args.M, args.N, args.spawn_rate, args.light_tick,
+                    args.smart, args.max_duration]
+    report = load_test_local(model_params, args.session_processes,
+                             engine = args.engine, **options)
+  print(json.dumps(report, indent = 2))
+  if not(report["ok"]): sys.exit(1)
+
+# Construye el parser con un subcomando por modo de uso
+def build_parser():
+  parser = argparse.ArgumentParser(prog = "crossroad",
+    description = "Simulación multiagentes de un cruce con 4 semáforos")
+  commands = parser.add_subparsers(dest = "command", required = True)
+
+  serve_parser = commands.add_parser("serve", help = "simula y sirve a Unity")
+  add_model_arguments(serve_parser)
+  serve_parser.add_argument("--max-duration", type = int, default = 3600)
+  serve_parser.add_argument("--port", type = int, default = 8585)
+  serve_parser.add_argument("--buffer", type = int, default = 0)
+  serve_parser.add_argument("--metrics", action = "store_true")
+  serve_parser.add_argument("--record", default = None)
+  serve_parser.add_argument("--events", default = None)
+  serve_parser.add_argument("--animate", action = "store_true")
+  serve_parser.add_argument("--log", action = "store_true")
+  serve_parser.add_argument("--sessions", type = int, default = None,
+                            metavar = "PROCESSES")
+  serve_parser.add_argument("--max-sessions", type = int, default = 64)
+  serve_parser.add_argument("--idle-timeout", type = float, default = 300)
+  serve_parser.add_argument("--max-steps", type = int, default = 1000)
+  serve_parser.set_defaults(handler = serve)
+
+  headless_parser = commands.add_parser("headless", help = "corre sin servidor")
+  add_model_arguments(headless_parser)
+  headless_parser.add_argument("--steps", type = int, default = 1000)
+  headless_parser.add_argument("--checkpoint", default = None)
+  headless_parser.add_argument("--checkpoint-every", type = int, default = 1000)
+  headless_parser.add_argument("--fast-forward", action = "store_true")
+  headless_parser.add_argument("--events", default = None)
+  headless_parser.add_argument("--heatmap", default = None)
+  headless_parser.add_argument("--heatmap-window", type = int, default = 3600)
+  headless_parser.set_defaults(handler = headless)
+
+  replay_parser = commands.add_parser("replay", help = "sirve un log grabado")
+  replay_parser.add_argument("path")
+  replay_parser.add_argument("--port", type = int, default = 8585)
+  replay_parser.add_argument("--speed", type = float, default = 1.0)
+  replay_parser.add_argument("--log", action = "store_true")
+  replay_parser.set_defaults(handler = replay)
+
+  render_parser = commands.add_parser("render", help = "escribe un log a video")
+  render_parser.add_argument("path")
+  render_parser.add_argument("output")
+  render_parser.add_argument("--fps", type = int, default = 10)
+  render_parser.add_argument("--stride", type = int, default = 1)
+  render_parser.add_argument("--downscale", type = int, default = 1)
+  render_parser.add_argument("--processes", type = int, default = None)
+  render_parser.add_argument("--batch-size", type = int, default = 64)
+  render_parser.add_argument("--cell-size", type = int, default = 1)
+  render_parser.set_defaults(handler = render)
+
+  loadtest_parser = commands.add_parser("loadtest",
+                                        help = "prueba de carga del servidor")
+  add_model_arguments(loadtest_parser)
+  loadtest_parser.add_argument("--max-duration", type = int, default = 3600)
+  loadtest_parser.add_argument("--host", default = "127.0.0.1")
+  loadtest_parser.add_argument("--port", type = int, default = None)
+  loadtest_parser.add_argument("--clients", type = int, default = 8)
+  loadtest_parser.add_argument("--duration", type = float, default = 10.0)
+  loadtest_parser.add_argument("--rate", type = float, default = 0)
+  loadtest_parser.add_argument("--request", default = "step",
+                               choices = ["step", "step-n", "step-binary"])
+  loadtest_parser.add_argument("--steps", type = int, default = 1)
+  loadtest_parser.add_argument("--sessions", action = "store_true")
+  loadtest_parser.add_argument("--session-processes", type = int, default = None)
+  loadtest_parser.add_argument("--timeout", type = float, default = 5.0)
+  loadtest_parser.add_argument("--stall-seconds", type = float, default = 1.0)
+  loadtest_parser.add_argument("--processes", type = int, default = None)
+  loadtest_parser.set_defaults(handler = loadtest)
+  return parser
+
+# Punto de entrada de python -m crossroad
+def main(argv = None):
+  args = build_parser().parse_args(argv)
+  args.handler(args)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,261 @@
+# Agentes de Mesa del cruce: carros y semáforos
+
+# Paquete esencial que ayuda a modelar sistemas multiagentes
+from mesa import Agent
+
+# Nativo de Python para los ticks sin límite de un semáforo sin cambios
+import math
+
+#@title Clase Carro
+
+class Car(Agent):
+  # Constructor
+  def __init__(self, id, model, state, origin, destination, start_pos):
+    # Construcción de la clase padre Agent
+    super().__init__(id, model)
+    self.id = id
+
+    # Estado del vehículo {-1: Por destruir, 0: Detenido, 1: Avanzando}
+    self.state = state
+    self.action = "spawned"
+
+    # Datos de ubicación y dirección del movimiento del vehículo
+    self.origin = origin
+    self.destination = destination
+    self.last_pos = start_pos
+    self.pos = start_pos
+    self.next_pos = None
+
+    # Giro que se lleva a cabo ("right", "left", "straight")
+    self.turn = self.model.directions[origin][destination]
+
+    # Ruta precompilada del origen al destino e índice de la celda actual
+    self.route = self.model.routes[(origin, destination)]
+    self.index = self.route.index[start_pos]
+
+    # Tick de aparición y ticks detenido, para los indicadores de tráfico
+    self.spawn_step = self.model.schedule.steps
+    self.stopped_ticks = 0
+
+    # Desplazamiento inicial
+    self.dx = -1 if self.origin == "West" else 1 if self.origin == "East" else 0
+    self.dy = 1 if self.origin == "North" else -1 if self.origin == "South" else 0
+
+  # Instante de acción, definición de cambios del agente en una nueva iteración
+  def step(self):
+    if self.state == -1:
+      # Una vez retrasada la destrucción (Para que Unity la note), se lleva a cabo
+      self.state = -2
+      return
+    was_stopped = self.state == 0
+
+    # Almacena a pos actual en una variable para Unity
+    self.last_pos = self.pos
+    
+    # Sistema de vueltas, el desplazamiento ya viene en la ruta
+    self.dx, self.dy = self.route.moves[self.index]
+
+    # Desde la última celda de la ruta el carro sale del modelo, así que
+    # prepara su destrucción
+    if self.index == self.route.last:
+      self.state = -1
+      self.action = "destroyed"
+      self.model.exited.append((self.destination, self.id, self.origin,
+                                self.spawn_step, self.stopped_ticks))
+      if self.model.kpis is not None:
+        self.model.kpis.car_finished(self.origin,
+          self.model.schedule.steps - self.spawn_step, self.stopped_ticks)
+      return
+
+    # Siguiente posición posible, puede que por detenerse no se mueva ahí
+    future_pos = self.route.cells[self.index + 1]
+
+    # Máquina de estados del carro
+    if self.state == 0 and not(self.see_red_light()) and self.see_free_road(future_pos):
+      # Para cambiar al carro detenido, checa el semáforo y por carros delante
+      self.state = 1
+    elif self.state == 1 and (self.see_red_light() or not(self.see_free_road(future_pos))):
+      # Para cambiar al carro avanzando, checa el semáforo y por carros delante
+      self.state = 0
+
+    # Solo guarda el desplazamiento si la máquina anterior así lo dice
+    self.next_pos = future_pos if self.state == 1 else self.next_pos
+
+    # Con el scheduler de conjunto activo, un carro detenido no se vuelve a
+    # activar hasta que cambie un semáforo o arranque el carro de enfrente.
+    # Al arrancar despierta a los carros que esperaban detrás de él
+    if self.model.active_set:
+      if self.state == 0:
+        self.model.schedule.park(self)
+      elif was_stopped:
+        self.model.wake_behind(self.pos)
+
+  # Ticks que el scheduler no activó al carro estacionado, todos detenido
+  def resume(self, skipped_ticks):
+    self.stopped_ticks += skipped_ticks
+
+  # Instante de acción, aplicación de cambios del agente en una nueva iteración
+  def advance(self):
+    # Solamente avanza si el estado lo marca, no mueve un carro detenido
+    if self.state == 1:
+      # Un carro que deja la línea de pararse cruza con su semáforo
+      if self.model.kpis is not None and self.route.stops[self.index]:
+        self.model.kpis.cars_discharged(self.route.light)
+      if self.model.heatmap is not None and self.action == "stopped":
+        self.model.heatmap.car_started(self.pos)
+
+      # Actualiza los valores y mueve al agente, también en el índice
+      self.model.remove_from_index(self, self.pos)
+      self.model.grid.move_agent(self, self.next_pos)
+      self.model.add_to_index(self, self.next_pos)
+      self.index += 1
+      self.action = "turning" if self.route.turning[self.index] else "moving"
+    elif self.state == 0:
+      if self.model.heatmap is not None and self.action != "stopped":
+        self.model.heatmap.car_stopped(self.pos)
+      self.action = "stopped"
+      self.stopped_ticks += 1
+    elif self.state == -2:
+      # Destruye al agente desde el modelo mismo
+      self.model.destroy_car(self)
+  
+  # Devuelve true ante un semáforo rojo, false en verde, amarillo o no semáforo
+  def see_red_light(self):
+    # No importa el semáforo si el carro no ha llegado a una línea de pararse
+    if not(self.route.stops[self.index]): return False
+
+    # El semáforo que rige al carro es el del lado opuesto a su origen
+    stoplight = self.model.stoplights_by_id[self.route.light]
+
+    # True si el semáforo está en rojo, false por lo contrario
+    return stoplight.state != "green"
+
+  # True si el carro está detenido y lo seguirá mientras no cambie nada en
+  # el cruce: ve rojo o tiene enfrente a otro carro, que también está detenido
+  def stays_stopped(self):
+    if self.state != 0 or self.index == self.route.last: return False
+    return (self.see_red_light() or
+            bool(self.model.cars_there(self.route.cells[self.index + 1])))
+
+  # Función de visión del espacio delante, true si se puede avanzar sin chocar
+  def see_free_road(self, future_pos):
+    for car in self.model.car_cells.get(future_pos, ()):
+      # Solo regresa false para un carro parado, bien pueden avanzar juntos
+      if car.state == 0:
+        return False
+    return True
+
+#@title Clase Semáforo
+
+class Stoplight(Agent):
+  # Constructor
+  def __init__(self, id, model, state, max_ticks, smart):
+    # Construcción de la clase padre Agent
+    super().__init__(id, model)
+    self.id = id
+
+    # Estado del semáforo: "red", "yellow", "green"
+    self.state = state
+    self.next_state = None
+    self.pos = self.model.stoplight_pos[id]
+
+    # Distancia de observación del semáforo, se desactiva si no hay carro ahí
+    self.preview_distance = 3
+    self.previewed_cells = self.get_previewed_cells()
+
+    # Contadores de steps que se puede estar en verde continuamente
+    self.max_ticks = max_ticks
+    self.ticks_on = 0
+    self.smart = smart
+
+  # Instante de acción, definición de los cambios del agente
+  def step(self):
+    # Booleano sabiendo si carros requieren pasar con este semáforo
+    cars_waiting = sum(self.model.cars_there(cell) for cell in self.previewed_cells)
+    if self.model.kpis is not None:
+      self.model.kpis.queue_sample(self.id, cars_waiting)
+
+    # Con un controlador externo el verde lo decide la acción que pidió
+    if self.model.light_request is not None:
+      self.step_requested()
+      return
+
+    # Máquina de estados del semáforo, iniciando por cambiar la inactividad
+    # Agrega a la fila al semáforo rojo que quiere activación
+    if self.state == "red" and (not(self.smart) or cars_waiting):
+      permission = self.model.ask_activation(self.id)
+      self.next_state = "green" if permission else self.next_state
+    # Termina el plazo de dos ticks en amarillo
+    elif self.state == "yellow" and self.ticks_on == self.max_ticks:
+      self.model.activation_queue.pop(0)
+      self.next_state = "red"
+      self.ticks_on = 0
+    # Termina un semáforo en verde por un máximo de ticks o por ser inteligente
+    elif self.state == "green" and (self.ticks_on == self.max_ticks - 2 or 
+        (self.smart and not(cars_waiting))):
+      # Pasa a amarillo dejando al contador de ticks con solo dos restantes
+      self.next_state = "yellow"
+      self.ticks_on = self.max_ticks - 2
+
+  # Máquina de estados con controlador externo: el semáforo pedido pasa a verde
+  # solo cuando todos los demás están en rojo, y uno en verde pasa a amarillo
+  # en cuanto se pide otro. El amarillo sigue durando dos ticks
+  def step_requested(self):
+    requested = self.model.light_request == self.id
+    if self.state == "red" and requested:
+      if all(stoplight.state == "red" for stoplight in self.model.stoplights):
+        self.next_state = "green"
+    elif self.state == "yellow" and self.ticks_on == self.max_ticks:
+      self.next_state = "red"
+      self.ticks_on = 0
+    elif self.state == "green" and not(requested):
+      self.next_state = "yellow"
+      self.ticks_on = self.max_ticks - 2
+
+  # Ticks seguidos en los que step() y advance() solo incrementarían
+  # ticks_on, suponiendo que los carros no se mueven; 0 si en el siguiente ya
+  # cambia algo y math.inf si nunca cambiaría por sí solo
+  def quiet_ticks(self):
+    cars_waiting = sum(self.model.cars_there(cell) for cell in self.previewed_cells)
+    if self.state == "red":
+      # Solo espera sin cambios si no pide el verde o ya está en la fila
+      # detrás de otro semáforo
+      if self.smart and not(cars_waiting): return math.inf
+      return math.inf if self.id in self.model.activation_queue[1:] else 0
+    if self.state == "yellow":
+      end = self.max_ticks
+    elif self.smart and not(cars_waiting):
+      return 0
+    else:
+      end = self.max_ticks - 2
+    return end - self.ticks_on if self.ticks_on <= end else math.inf
+
+  # Actualización de estados según la máquina en step()
+  def advance(self):
+    # Incrementa el contador de ticks para limitar el tiempo en verde/amarillo
+    if self.state != "red": self.ticks_on += 1
+
+    # Actualiza el estado según lo necesario a menos de que no exista uno nuevo
+    if self.next_state is not None:
+      # Al volver a rojo termina la fase de paso de este semáforo
+      if (self.model.kpis is not None and self.state != "red" and
+          self.next_state == "red"):
+        self.model.kpis.phase_ended(self.id)
+      # Los carros en las líneas de pararse vuelven a revisar su semáforo
+      if self.model.active_set and self.state != self.next_state:
+        self.model.wake_cars(self.model.stop_points)
+      self.state = self.next_state
+  
+  # Devuelve la lista de celdas que el semáforo observa según la distancia eleginda
+  def get_previewed_cells(self):
+    previewed_cells = []
+    for i in range(self.preview_distance):
+      if self.id == "North":
+        previewed_cells.append((self.pos[0] - 1, self.pos[1] + 3 + i))
+      elif self.id == "West":
+        previewed_cells.append((self.pos[0] - 3 - i, self.pos[1] - 1))
+      elif self.id == "South":
+        previewed_cells.append((self.pos[0] + 1, self.pos[1] - 3 - i))
+      elif self.id == "East":
+        previewed_cells.append((self.pos[0] + 3 + i, self.pos[1] + 1))
+    return previewed_cells
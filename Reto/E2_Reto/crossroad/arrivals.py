@@ -0,0 +1,210 @@
+# Llegadas de carros generadas por adelantado según perfiles de demanda
+
+# Paquete matemático utilizado para matrices de declaración sencilla
+import numpy as np
+
+# Nativo de Python para leer trazas de llegadas
+import csv
+
+from .engine import DIRECTIONS
+
+#@title Perfiles de demanda
+
+# Demanda de carros por lado. Las subclases dicen en qué ticks llegan carros
+# por un origen y esta clase les asigna un destino con la matriz
+# origen-destino: pesos por origen (fila) y destino (columna) en el orden de
+# DIRECTIONS, o un diccionario de diccionarios. Sin matriz, los destinos son
+# uniformes entre los otros tres lados
+class Demand:
+  # Constructor
+  def __init__(self, od_matrix = None):
+    if od_matrix is None:
+      od_matrix = 1 - np.eye(len(DIRECTIONS))
+    elif isinstance(od_matrix, dict):
+      od_matrix = [[od_matrix.get(origin, {}).get(destination, 0)
+                    for destination in DIRECTIONS] for origin in DIRECTIONS]
+    od_matrix = np.array(od_matrix, dtype=float)
+    if od_matrix.shape != (len(DIRECTIONS), len(DIRECTIONS)):
+      raise ValueError("La matriz origen-destino debe ser de 4×4")
+    if np.diagonal(od_matrix).any():
+      raise ValueError("Un carro no puede salir por el lado en que entró")
+    if (od_matrix.sum(axis = 1) <= 0).any():
+      raise ValueError("Cada origen necesita algún destino con peso")
+
+    # Probabilidades acumuladas por origen para muestrear destinos
+    self.od_cumulative = np.cumsum(od_matrix / od_matrix.sum(axis = 1,
+                                   keepdims = True), axis = 1)
+
+  # Ticks de llegada de los carros del origen dado entre start y stop, en
+  # orden y uno por carro. Devuelve también sus destinos, con -1 en los que se
+  # muestrean, o None para muestrear todos
+  def arrivals(self, origin, rng, start, stop):
+    raise NotImplementedError
+
+  # Muestrea destinos para n carros del origen dado
+  def destinations(self, origin, rng, n):
+    cumulative = self.od_cumulative[origin]
+    return np.minimum(np.searchsorted(cumulative, rng.random(n), side = "right"),
+                      len(DIRECTIONS) - 1)
+
+# Convierte una tasa por lado a un arreglo en el orden de DIRECTIONS
+def rates_by_origin(rates):
+  if isinstance(rates, dict):
+    return np.array([rates.get(dir, 0.0) for dir in DIRECTIONS], dtype=float)
+  return np.full(len(DIRECTIONS), float(rates))
+
+# Ticks con llegadas dadas las tasas esperadas de carros por tick. "poisson"
+# permite varios carros en un tick; "bernoulli" llega a lo más uno, igual que
+# SPAWN_RATE
+def sample_ticks(rng, rates, start, process):
+  if process == "poisson":
+    counts = rng.poisson(rates)
+  elif process == "bernoulli":
+    counts = (rng.random(len(rates)) < rates).astype(np.int64)
+  else:
+    raise ValueError(f"Proceso de llegadas desconocido: {process}")
+  return np.repeat(np.arange(start, start + len(rates)), counts)
+
+# Llegadas con una tasa constante por lado, en carros por tick
+class PoissonDemand(Demand):
+  # Constructor
+  def __init__(self, rates, od_matrix = None, process = "poisson"):
+    super().__init__(od_matrix)
+    self.rates = rates_by_origin(rates)
+    self.process = process
+
+  # Ticks de llegada con la tasa del origen dado
+  def arrivals(self, origin, rng, start, stop):
+    rates = np.full(stop - start, self.rates[origin])
+    return sample_ticks(rng, rates, start, self.process), None
+
+# Llegadas cuya tasa cambia con el tiempo. profile es una lista de
+# (tick de inicio, tasas) ordenada por tick; las tasas siguen vigentes hasta
+# el siguiente cambio. Con period el perfil se repite, por ejemplo cada día
+class TimeVaryingDemand(Demand):
+  # Constructor
+  def __init__(self, profile, period = None, od_matrix = None,
+               process = "poisson"):
+    super().__init__(od_matrix)
+    self.starts = np.array([start for start, _ in profile])
+    self.rates = np.array([rates_by_origin(rates) for _, rates in profile])
+    self.period = period
+    self.process = process
+
+  # Ticks de llegada con la tasa vigente en cada tick
+  def arrivals(self, origin, rng, start, stop):
+    ticks = np.arange(start, stop)
+    if self.period is not None: ticks = ticks % self.period
+    segment = np.maximum(np.searchsorted(self.starts, ticks, side = "right") - 1, 0)
+    rates = self.rates[segment, origin]
+    return sample_ticks(rng, rates, start, self.process), None
+
+# Demanda de hora pico: base fuera del pico y peak durante peak_length ticks
+# a partir de peak_start, repetida cada period ticks
+def peak_demand(base, peak, peak_start, peak_length, period = None,
+                od_matrix = None, process = "poisson"):
+  return TimeVaryingDemand([(0, base), (peak_start, peak),
+                            (peak_start + peak_length, base)],
+                           period, od_matrix, process)
+
+# Llegadas tomadas de una traza: una lista de (tick, origen) o
+# (tick, origen, destino), con los lados por nombre. Los destinos que faltan
+# se muestrean con la matriz origen-destino
+class TraceDemand(Demand):
+  # Constructor
+  def __init__(self, events, od_matrix = None):
+    super().__init__(od_matrix)
+    events = sorted((int(event[0]), DIRECTIONS.index(event[1]),
+                     DIRECTIONS.index(event[2]) if len(event) > 2 and event[2]
+                     else -1) for event in events)
+    events = np.array(events, dtype=np.int64).reshape(-1, 3)
+    self.ticks = [events[events[:, 1] == o, 0] for o in range(len(DIRECTIONS))]
+    self.destinations_by_origin = [events[events[:, 1] == o, 2]
+                                   for o in range(len(DIRECTIONS))]
+
+  # Llegadas de la traza entre start y stop; los destinos vacíos son -1
+  def arrivals(self, origin, rng, start, stop):
+    ticks = self.ticks[origin]
+    low, high = np.searchsorted(ticks, [start, stop])
+    return ticks[low:high], self.destinations_by_origin[origin][low:high]
+
+# Lee una traza CSV con columnas tick, origin y opcionalmente destination
+def load_trace(path, od_matrix = None):
+  with open(path, newline = "") as trace_file:
+    events = [(row["tick"], row["origin"], row.get("destination"))
+              for row in csv.DictReader(trace_file)]
+  return TraceDemand(events, od_matrix)
+
+#@title Calendario de llegadas
+
+# Llegadas de una corrida generadas por bloques de ticks con NumPy. Cada
+# origen tiene generadores propios derivados de la semilla, uno para los
+# ticks y otro para los destinos, así que dos corridas con la misma semilla
+# ven los mismos carros (números aleatorios comunes) sin importar el motor,
+# el controlador, el tamaño de bloque o la demanda de otros lados
+class ArrivalSchedule:
+  # Constructor
+  def __init__(self, demand, seed = None, block_size = 1024):
+    self.demand = demand
+    self.block_size = block_size
+
+    # Las semillas de texto, como las de los cruces de una ciudad, se usan
+    # por sus bytes
+    if isinstance(seed, str): seed = list(seed.encode("utf-8"))
+    streams = [np.random.default_rng(sequence) for sequence in
+               np.random.SeedSequence(seed).spawn(2 * len(DIRECTIONS))]
+    self.tick_streams = streams[:len(DIRECTIONS)]
+    self.destination_streams = streams[len(DIRECTIONS):]
+
+    # Bloque actual: origen y destino de cada llegada en orden de tick y el
+    # índice de la primera llegada de cada tick
+    self.block_start = 0
+    self.block_end = 0
+    self.origins = np.zeros(0, dtype=np.int64)
+    self.destinations = np.zeros(0, dtype=np.int64)
+    self.offsets = np.zeros(1, dtype=np.int64)
+
+  # Genera el siguiente bloque de llegadas para todos los orígenes
+  def generate(self):
+    start, stop = self.block_end, self.block_end + self.block_size
+    ticks, origins, destinations = [], [], []
+    for origin, rng in enumerate(self.tick_streams):
+      origin_ticks, origin_destinations = self.demand.arrivals(origin, rng,
+                                                               start, stop)
+      if origin_destinations is None:
+        origin_destinations = np.full(len(origin_ticks), -1)
+      else:
+        origin_destinations = origin_destinations.copy()
+      missing = origin_destinations < 0
+      if missing.any():
+        origin_destinations[missing] = self.demand.destinations(origin,
+          self.destination_streams[origin], int(missing.sum()))
+      ticks.append(origin_ticks)
+      origins.append(np.full(len(origin_ticks), origin))
+      destinations.append(origin_destinations)
+    ticks = np.concatenate(ticks)
+    order = np.argsort(ticks, kind = "stable")
+    self.origins = np.concatenate(origins)[order]
+    self.destinations = np.concatenate(destinations)[order]
+    self.offsets = np.searchsorted(ticks[order], np.arange(start, stop + 1))
+    self.block_start, self.block_end = start, stop
+
+  # Primer tick desde tick con alguna llegada, o stop si no hay antes de él
+  def next_arrival(self, tick, stop):
+    while tick < stop:
+      while tick >= self.block_end: self.generate()
+      # Los ticks sin llegadas repiten el índice de su primera llegada
+      k = np.searchsorted(self.offsets, self.offsets[tick - self.block_start],
+                          side = "right") - 1
+      if k < self.block_size: return min(self.block_start + int(k), stop)
+      tick = self.block_end
+    return stop
+
+  # Llegadas (origen, destino) del tick dado, como índices de DIRECTIONS. Los
+  # ticks se piden en orden, así que solo se recorre el bloque con un cursor
+  def arrivals(self, tick):
+    while tick >= self.block_end: self.generate()
+    low = self.offsets[tick - self.block_start]
+    high = self.offsets[tick - self.block_start + 1]
+    return zip(self.origins[low:high].tolist(),
+               self.destinations[low:high].tolist())
@@ -0,0 +1,183 @@
+# Benchmarks de los pasos del modelo, la captura, el reporte y el servidor
+
+# Paquete matemático utilizado para matrices de declaración sencilla
+import numpy as np
+
+# Nativos de Python para medir la memoria y el entorno de los benchmarks
+from http.server import ThreadingHTTPServer
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+from .collector import GridCollector, get_grid
+from .frames import FrameEncoder
+from .model import CrossroadModel
+from .server import SimulationServer
+
+#@title Benchmarks
+
+# Carpeta del paquete, para arrancar procesos que lo importen
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Escenarios fijos (M, N, SPAWN_RATE) para comparar motores y cambios
+BENCHMARK_SIZES = [(16, 16), (32, 32), (64, 64)]
+BENCHMARK_SPAWN_RATES = [0.15, 0.5, 0.9]
+
+# Resumen en milisegundos de una lista de latencias en segundos
+def latency_stats(latencies):
+  latencies = np.array(latencies) * 1000
+  return {"mean_ms": float(latencies.mean()),
+          "p50_ms": float(np.percentile(latencies, 50)),
+          "p95_ms": float(np.percentile(latencies, 95)),
+          "p99_ms": float(np.percentile(latencies, 99)),
+          "max_ms": float(latencies.max())}
+
+# Modelo de benchmark ya calentado para que tenga tráfico desde el inicio
+def benchmark_model(M, N, SPAWN_RATE, warmup, seed, **options):
+  model = CrossroadModel(M, N, SPAWN_RATE, 8, True, None, seed = seed,
+                         **options)
+  for _ in range(warmup): model.step()
+  return model
+
+# Latencia de CrossroadModel.step por tamaño de cuadrícula y SPAWN_RATE, con
+# la memoria pico y el crecimiento de bloques vivos por step
+def bench_model_step(steps = 200, warmup = 100, seed = 0, engine = "agents"):
+  results = []
+  for M, N in BENCHMARK_SIZES:
+    for SPAWN_RATE in BENCHMARK_SPAWN_RATES:
+      model = benchmark_model(M, N, SPAWN_RATE, warmup, seed,
+                              COLLECT_FRAMES = False, ENGINE = engine)
+      latencies = []
+      tracemalloc.start()
+      blocks = sys.getallocatedblocks()
+      for _ in range(steps):
+        start = time.perf_counter()
+        model.step()
+        latencies.append(time.perf_counter() - start)
+      blocks_per_step = (sys.getallocatedblocks() - blocks) / steps
+      _, peak = tracemalloc.get_traced_memory()
+      tracemalloc.stop()
+      results.append({"benchmark": "model_step", "engine": engine, "M": M,
+                      "N": N, "SPAWN_RATE": SPAWN_RATE, "steps": steps,
+                      **latency_stats(latencies), "peak_kib": peak / 1024,
+                      "blocks_per_step": blocks_per_step})
+  return results
+
+# Costo de capturar la cuadrícula: get_grid y el recolector con y sin deltas
+def bench_capture(repeat = 200, warmup = 100, seed = 0):
+  results = []
+  for M, N in BENCHMARK_SIZES:
+    model = benchmark_model(M, N, 0.5, warmup, seed, COLLECT_FRAMES = False)
+    for name, capture in [("get_grid", get_grid),
+                          ("collect", GridCollector().collect),
+                          ("collect_delta", GridCollector(delta = True).collect)]:
+      latencies = []
+      for _ in range(repeat):
+        start = time.perf_counter()
+        capture(model)
+        latencies.append(time.perf_counter() - start)
+      results.append({"benchmark": "capture", "capture": name, "M": M, "N": N,
+                      "repeat": repeat, **latency_stats(latencies)})
+  return results
+
+# Costo de reportar y serializar: JSON doble de "step" y formato binario.
+# El modelo avanza entre mediciones para que los deltas tengan cambios
+def bench_report(repeat = 200, warmup = 200, seed = 0):
+  results = []
+  for SPAWN_RATE in BENCHMARK_SPAWN_RATES:
+    model = benchmark_model(32, 32, SPAWN_RATE, warmup, seed,
+                            COLLECT_FRAMES = False)
+    encoder = FrameEncoder()
+    def report_json():
+      cars, lights = model.report_actions()
+      return json.dumps({"carsJson": json.dumps(cars),
+                         "lightsJson": json.dumps(lights)})
+    def report_binary():
+      return encoder.encode(*model.report_columns())
+    formats = [("json", report_json), ("binary", report_binary)]
+    latencies = {name: [] for name, _ in formats}
+    sizes = {name: 0 for name, _ in formats}
+    for _ in range(repeat):
+      model.step()
+      for name, report in formats:
+        start = time.perf_counter()
+        sizes[name] += len(report())
+        latencies[name].append(time.perf_counter() - start)
+    for name, _ in formats:
+      results.append({"benchmark": "report", "format": name,
+                      "SPAWN_RATE": SPAWN_RATE, "mean_bytes": sizes[name] / repeat,
+                      "repeat": repeat, **latency_stats(latencies[name])})
+  return results
+
+# Ida y vuelta completa de un "step" contra un servidor local con conexión
+# persistente, como la haría Unity
+def bench_server_round_trip(requests = 200, seed = 0):
+  import http.client
+  SimulationServer.model = CrossroadModel(32, 32, 0.5, 8, True, 3600,
+                                          COLLECT_FRAMES = False, seed = seed)
+  SimulationServer.buffer_size = 0
+  SimulationServer.start_time = time.time()
+  httpd = ThreadingHTTPServer(("127.0.0.1", 0), SimulationServer)
+  thread = threading.Thread(target = httpd.serve_forever, daemon = True)
+  thread.start()
+  connection = http.client.HTTPConnection("127.0.0.1", httpd.server_address[1])
+
+  # Mismo saludo que el cliente de Unity antes de pedir steps
+  def post(request):
+    connection.request("POST", "/", json.dumps({"request": request}))
+    return connection.getresponse().read()
+  post("board-init")
+  post("lights-init")
+  latencies = []
+  for _ in range(requests):
+    start = time.perf_counter()
+    post("step")
+    latencies.append(time.perf_counter() - start)
+  connection.close()
+  httpd.shutdown()
+  httpd.server_close()
+  SimulationServer.initialized = False
+  return [{"benchmark": "server_round_trip", "requests": requests,
+           **latency_stats(latencies)}]
+
+# Arranque en frío de un proceso que corre sin servidor, como los del pool
+# de parameter_sweep: intérprete, imports del paquete y un step. También
+# revisa que no se hayan cargado matplotlib ni pandas
+def bench_cold_start(repeat = 5):
+  code = ("import sys; from crossroad.headless import run_headless; "
+          "run_headless([16, 16, 0.15, 8, True], 1); "
+          "print(int('matplotlib' in sys.modules or 'pandas' in sys.modules))")
+  environment = dict(os.environ, PYTHONPATH = os.path.dirname(PACKAGE_DIR))
+  latencies = []
+  heavy_imports = False
+  for _ in range(repeat):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", code], env = environment,
+                            capture_output = True, check = True, text = True)
+    latencies.append(time.perf_counter() - start)
+    heavy_imports |= output.stdout.strip() == "1"
+  return [{"benchmark": "cold_start", "repeat": repeat,
+           "heavy_imports": heavy_imports, **latency_stats(latencies)}]
+
+# Corre todos los benchmarks y guarda los resultados en JSON junto con los
+# datos del entorno. quick reduce las repeticiones para una revisión rápida
+def run_benchmarks(path = "bench_results.json", quick = False, seed = 0):
+  scale = 5 if quick else 1
+  results = []
+  for engine in ("agents", "arrays"):
+    results += bench_model_step(200 // scale, 100 // scale, seed, engine)
+  results += bench_capture(200 // scale, 100 // scale, seed)
+  results += bench_report(200 // scale, 200 // scale, seed)
+  results += bench_server_round_trip(200 // scale, seed)
+  results += bench_cold_start(max(1, 10 // scale))
+  report = {"python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "seed": seed, "quick": quick,
+            "date": datetime.datetime.now().isoformat(), "results": results}
+  with open(path, "w") as results_file: json.dump(report, results_file, indent = 2)
+  return report
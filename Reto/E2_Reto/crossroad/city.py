@@ -0,0 +1,211 @@
+# Red de varios cruces que se pueden simular en varios procesos
+
+# Nativo de Python para repartir los cruces en procesos
+import multiprocessing
+
+from .kpis import RunningStat
+from .model import CrossroadModel
+
+#@title Ciudad de varios cruces
+
+# Cruce vecino hacia el que sale un carro por cada lado de un bloque. El lado
+# "South" es el de y máxima y el "West" el de x máxima, como en define_points
+NEIGHBOR_OFFSETS = {"North": (0, -1), "West": (1, 0), "South": (0, 1),
+                    "East": (-1, 0)}
+
+# Lado por el que entra al vecino un carro que sale por cada lado
+OPPOSITE_SIDES = {"North": "South", "West": "East", "South": "North",
+                  "East": "West"}
+
+# Grupo de cruces de una ciudad que se simulan juntos en un mismo proceso.
+# Los carros viajan entre cruces como registros de su recorrido en la
+# ciudad: id, lado por el que entraron a la ciudad, tick de aparición, ticks
+# detenido sumados en todos los cruces y bloques que ya recorrieron
+class CityShard:
+  # Constructor, blocks relaciona cada bloque (i, j) con sus parámetros y
+  # con los lados que conectan con otro cruce
+  def __init__(self, blocks):
+    self.models = {}
+    self.inner_sides = {}
+    for block, (params, options, inner_sides) in blocks.items():
+      model = CrossroadModel(*params, **options)
+      # Por los lados interiores solo entran carros de los vecinos
+      for side in inner_sides: model.spawn_rates[side] = 0
+      self.models[block] = model
+      self.inner_sides[block] = inner_sides
+
+    # Ids de los carros que en el último tick pasaron a un cruce vecino
+    self.crossing = {block: set() for block in self.models}
+
+  # Agrega las llegadas de los vecinos, avanza cada cruce un tick y devuelve
+  # los registros de los carros que salieron por cada lado de cada bloque
+  def step(self, arrivals):
+    for (block, side), trips in arrivals.items():
+      self.models[block].arrivals[side].extend(trips)
+    exits = {}
+    for block, model in self.models.items():
+      model.step()
+      self.crossing[block] = set()
+      for side, car_id, origin, spawn_step, stopped_ticks in model.exited:
+        # Un carro que apareció en este cruce empieza su registro al salir
+        trip = model.trips.pop(car_id, None)
+        if trip is None:
+          trip = {"id": car_id, "origin": origin, "spawn_step": spawn_step,
+                  "stopped_ticks": 0, "route": []}
+        trip["stopped_ticks"] += stopped_ticks
+        trip["route"].append(block)
+        exits.setdefault((block, side), []).append(trip)
+        if side in self.inner_sides[block]: self.crossing[block].add(car_id)
+    return exits
+
+  # Reporte de acciones de cada bloque del grupo. Un carro que cambia de
+  # cruce no desaparece de la ciudad: sale y entra al vecino avanzando, con
+  # el mismo id
+  def report(self):
+    reports = {}
+    for block, model in self.models.items():
+      cars, lights = model.report_actions()
+      for car in cars["Items"]:
+        if ((car["action"] == "destroyed" and car["id"] in self.crossing[block]) or
+            (car["action"] == "spawned" and car["id"] in model.trips)):
+          car["action"] = "moving"
+      reports[block] = (cars, lights)
+    return reports
+
+# Proceso que mantiene vivo un grupo de cruces, atendiendo órdenes por un Pipe
+def _city_shard_worker(conn, blocks):
+  shard = CityShard(blocks)
+  while True:
+    command, payload = conn.recv()
+    if command == "step":
+      conn.send(shard.step(payload))
+    elif command == "report":
+      conn.send(shard.report())
+    else:
+      break
+  conn.close()
+
+# Red de K×L cruces iguales de M×N celdas. Los carros que salen por un lado
+# de un cruce entran al vecino por el lado opuesto un tick después, con el
+# mismo id, que es único en toda la ciudad. Con SHARDS > 1 los cruces se
+# reparten en procesos que avanzan en paralelo y solo intercambian los
+# registros de los carros que cruzan de un grupo a otro. Al salir de la
+# ciudad se cuentan su tiempo de recorrido y detenido en toda la red
+class CityModel:
+  # Constructor
+  def __init__(self, K, L, M, N, SPAWN_RATE, LIGHT_TICK, SMART, MAX_DURATION,
+               SHARDS = 1, ENGINE = "agents", seed = None):
+    self.k = K
+    self.l = L
+    self.m = K * M
+    self.n = L * N
+    self.block_m = M
+    self.block_n = N
+    self.max_duration = MAX_DURATION
+    self.steps = 0
+    self.cars_finished = 0
+    self.travel_time = RunningStat()
+    self.stopped_time = RunningStat()
+
+    # Parámetros de cada cruce. Solo aparecen carros por los lados que dan
+    # hacia afuera de la ciudad y cada cruce tiene su propia semilla. Los
+    # ids de sus carros nuevos llevan el número del bloque, i * L + j, como
+    # residuo módulo K * L
+    blocks = {}
+    for i in range(K):
+      for j in range(L):
+        options = {"COLLECT_FRAMES": False, "ENGINE": ENGINE,
+                   "ID_OFFSET": i * L + j, "ID_STRIDE": K * L,
+                   "seed": None if seed is None else f"{seed}-{i}-{j}"}
+        inner_sides = [side for side, (di, dj) in NEIGHBOR_OFFSETS.items()
+                       if self.has_block((i + di, j + dj))]
+        blocks[(i, j)] = ([M, N, SPAWN_RATE, LIGHT_TICK, SMART, MAX_DURATION],
+                          options, inner_sides)
+
+    # Grupos contiguos de bloques, uno por proceso
+    keys = sorted(blocks)
+    size = -(-len(keys) // SHARDS)
+    groups = [keys[start:start + size] for start in range(0, len(keys), size)]
+    self.shard_of = {block: g for g, group in enumerate(groups) for block in group}
+
+    # Con un solo grupo se simula en este proceso, sin Pipes
+    self.shard = CityShard(blocks) if len(groups) == 1 else None
+    self.workers = []
+    if self.shard is None:
+      for group in groups:
+        group_blocks = {block: blocks[block] for block in group}
+        parent_conn, child_conn = multiprocessing.Pipe()
+        worker = multiprocessing.Process(target = _city_shard_worker,
+          args = (child_conn, group_blocks), daemon = True)
+        worker.start()
+        self.workers.append((worker, parent_conn))
+
+    # Llegadas pendientes por grupo para el siguiente tick
+    self.pending = [{} for _ in groups]
+
+  # True si el bloque existe dentro de la ciudad
+  def has_block(self, block):
+    return 0 <= block[0] < self.k and 0 <= block[1] < self.l
+
+  # Avanza toda la ciudad un tick y reparte los carros que cambian de cruce
+  def step(self):
+    if self.workers:
+      for (worker, conn), arrivals in zip(self.workers, self.pending):
+        conn.send(("step", arrivals))
+      all_exits = [conn.recv() for worker, conn in self.workers]
+    else:
+      all_exits = [self.shard.step(self.pending[0])]
+
+    self.pending = [{} for _ in self.pending]
+    for exits in all_exits:
+      for ((i, j), side), trips in exits.items():
+        di, dj = NEIGHBOR_OFFSETS[side]
+        neighbor = (i + di, j + dj)
+        if not(self.has_block(neighbor)):
+          # Salida de la ciudad, el recorrido del carro termina
+          for trip in trips: self.trip_finished(trip)
+          continue
+        # Entra al vecino por el lado opuesto al que salió
+        entry = OPPOSITE_SIDES[side]
+        arrivals = self.pending[self.shard_of[neighbor]]
+        arrivals.setdefault((neighbor, entry), []).extend(trips)
+    self.steps += 1
+
+  # Un carro salió de la ciudad, con los ticks contados como en TrafficKPIs
+  def trip_finished(self, trip):
+    self.cars_finished += 1
+    self.travel_time.add(self.steps - trip["spawn_step"])
+    self.stopped_time.add(trip["stopped_ticks"])
+
+  # Tiempos de recorrido y detenido de los carros que salieron de la ciudad
+  def summary(self):
+    return {"cars_finished": self.cars_finished,
+            "travel_time": self.travel_time.summary(),
+            "stopped_time": self.stopped_time.summary()}
+
+  # Reporte de toda la ciudad en coordenadas globales, marcando el bloque
+  def report_actions(self):
+    if self.workers:
+      for worker, conn in self.workers: conn.send(("report", None))
+      reports = {}
+      for worker, conn in self.workers: reports.update(conn.recv())
+    else:
+      reports = self.shard.report()
+
+    cars, lights = [], []
+    for (i, j), (block_cars, block_lights) in sorted(reports.items()):
+      offset_x, offset_y = i * self.block_m, j * self.block_n
+      for car in block_cars["Items"]:
+        cars.append(dict(car, block = [i, j], x1 = car["x1"] + offset_x,
+          y1 = car["y1"] + offset_y, x2 = car["x2"] + offset_x,
+          y2 = car["y2"] + offset_y))
+      for light in block_lights["Items"]:
+        lights.append(dict(light, block = [i, j]))
+    return {"Items": cars}, {"Items": lights}
+
+  # Termina los procesos de los grupos
+  def close(self):
+    for worker, conn in self.workers:
+      conn.send(("close", None))
+      worker.join()
+    self.workers = []
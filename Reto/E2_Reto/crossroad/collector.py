@@ -0,0 +1,142 @@
+# Captura de las cuadrículas del modelo para animarlas después
+
+# Paquete matemático utilizado para matrices de declaración sencilla
+import numpy as np
+
+# Nativo de Python para el buffer circular de cuadrículas
+import collections
+
+#@title Recolector del modelo
+
+# Códigos de color de la animación para cada tipo de terreno estático
+TERRAIN_CODES = {"crossroad": 2, "crosswalk": 3, "curb": 4, "street": 5,
+                 "garden": 9}
+
+# Códigos de color de la animación para cada estado de un semáforo
+LIGHT_CODES = {"green": 6, "yellow": 7, "red": 8}
+
+# Devuelve las celdas que cambian en cada tick: carros y semáforos sobre el
+# terreno. Son arreglos paralelos (y, x, código) en coordenadas transpuestas
+def get_dynamic_cells(model):
+  # Celdas ocupadas según el índice del modelo, más de un carro es un choque
+  if model.car_arrays is not None:
+    xs, ys, counts = model.car_arrays.occupied_cells()
+    ys, xs = ys.tolist(), xs.tolist()
+    codes = [0 if count == 1 else 1 for count in counts.tolist()]
+  else:
+    car_cells = model.car_cells
+    ys = [pos[1] for pos in car_cells]
+    xs = [pos[0] for pos in car_cells]
+    codes = [0 if len(cars) == 1 else 1 for cars in car_cells.values()]
+
+  # Los semáforos se dibujan con el color de su estado actual
+  for stoplight in model.stoplights:
+    ys.append(stoplight.pos[1])
+    xs.append(stoplight.pos[0])
+    codes.append(LIGHT_CODES[stoplight.state])
+  return (np.array(ys, dtype=np.intp), np.array(xs, dtype=np.intp),
+          np.array(codes, dtype=np.uint8))
+
+# Función auxiliar para capturar el modelo en un instante
+def get_grid(model):
+  # Copia la capa estática del terreno y solo dibuja encima lo que se mueve
+  grid = model.terrain_layer.copy()
+  ys, xs, codes = get_dynamic_cells(model)
+  grid[ys, xs] = codes
+  # La capa ya está transpuesta para que (x,y) queden como cartesianas
+  return grid
+
+#@title Almacén de cuadrículas
+
+# Almacena las cuadrículas de cada tick en uint8, con un límite opcional de
+# cuadros (buffer circular) y codificación opcional por diferencias
+class GridCollector:
+  # Constructor
+  def __init__(self, limit = None, delta = False, keyframe_interval = 100):
+    # Límite de cuadros guardados, None para conservar toda la ejecución
+    self.limit = limit
+    self.delta = delta
+    self.keyframe_interval = keyframe_interval
+
+    # Cada cuadro es ("key", arreglo) o ("delta", (índices, valores))
+    self.frames = collections.deque()
+    self.first_step = 0
+    self.collected = 0
+
+    # Estado del último cuadro para calcular el siguiente delta
+    self.last_frame = None
+    self.last_dynamic = None
+
+  # Captura el modelo en su instante actual, como el DataCollector de Mesa
+  def collect(self, model):
+    ys, xs, codes = get_dynamic_cells(model)
+    if not(self.delta):
+      frame = model.terrain_layer.copy()
+      frame[ys, xs] = codes
+      self.append(("key", frame))
+      return
+
+    # Sin cuadro previo o al cumplirse el intervalo se guarda uno completo
+    if (self.last_frame is None or
+        self.collected % self.keyframe_interval == 0):
+      self.last_frame = model.terrain_layer.copy()
+      self.last_frame[ys, xs] = codes
+      self.append(("key", self.last_frame.copy()))
+    else:
+      # Solo cambian las celdas dinámicas anteriores (que vuelven a terreno)
+      # y las actuales, por lo que el costo depende de los agentes móviles
+      width = self.last_frame.shape[1]
+      old_ys, old_xs = self.last_dynamic
+      new_frame = self.last_frame
+      new_frame[old_ys, old_xs] = model.terrain_layer[old_ys, old_xs]
+      new_frame[ys, xs] = codes
+      indices = np.unique(np.concatenate((old_ys * width + old_xs,
+                                          ys * width + xs)))
+      self.append(("delta", (indices.astype(np.uint32),
+                             new_frame.ravel()[indices])))
+    self.last_dynamic = (ys, xs)
+
+  # Agrega un cuadro respetando el límite del buffer circular
+  def append(self, entry):
+    self.frames.append(entry)
+    self.collected += 1
+    if self.limit is not None and len(self.frames) > self.limit:
+      # Si el nuevo primer cuadro es un delta, se convierte en completo
+      if self.frames[1][0] == "delta":
+        self.frames[1] = ("key", self[1])
+      self.frames.popleft()
+      self.first_step += 1
+
+  # Número de cuadros disponibles actualmente
+  def __len__(self):
+    return len(self.frames)
+
+  # Reconstruye el cuadro i partiendo del cuadro completo anterior más cercano
+  def __getitem__(self, i):
+    if i < 0: i += len(self.frames)
+    if not(0 <= i < len(self.frames)): raise IndexError(i)
+    start = i
+    while self.frames[start][0] != "key": start -= 1
+    frame = self.frames[start][1].copy()
+    for j in range(start + 1, i + 1):
+      indices, values = self.frames[j][1]
+      frame.ravel()[indices] = values
+    return frame
+
+  # Recorre los cuadros en orden aplicando los deltas uno tras otro
+  def __iter__(self):
+    frame = None
+    for kind, data in self.frames:
+      if kind == "key":
+        frame = data.copy()
+      else:
+        indices, values = data
+        frame.ravel()[indices] = values
+      yield frame.copy()
+
+  # Compatibilidad con el DataCollector de Mesa para análisis con pandas
+  # pandas se importa solo aquí para no cargarlo en cada proceso
+  def get_model_vars_dataframe(self):
+    import pandas as pd
+    return pd.DataFrame({"Grid": list(self)},
+      index = range(self.first_step, self.first_step + len(self.frames)))
@@ -0,0 +1,281 @@
+# Motor vectorizado de carros con NumPy
+
+# Paquete matemático utilizado para matrices de declaración sencilla
+import numpy as np
+
+#@title Motor vectorizado de carros
+
+# Nombres en el orden de los índices enteros que usa el motor vectorizado
+DIRECTIONS = ["North", "West", "South", "East"]
+TURNS = ["straight", "right", "left"]
+ACTIONS = ["spawned", "moving", "turning", "stopped", "destroyed"]
+LIGHT_STATES = ["red", "yellow", "green"]
+
+# Desplazamiento inicial según el origen, en el orden de DIRECTIONS
+ORIGIN_DX = np.array([0, -1, 0, 1])
+ORIGIN_DY = np.array([1, 0, -1, 0])
+
+# Estado de todos los carros en arreglos paralelos de NumPy, en orden de id.
+# Aplica por lotes las mismas reglas de Car.step y Car.advance, reportando
+# exactamente lo mismo que los agentes de Mesa
+class CarArrays:
+  # Columnas del estado de cada carro con su tipo de dato
+  FIELDS = [("id", np.int64), ("x", np.int64), ("y", np.int64),
+            ("dx", np.int64), ("dy", np.int64), ("last_x", np.int64),
+            ("last_y", np.int64), ("next_x", np.int64), ("next_y", np.int64),
+            ("state", np.int8), ("origin", np.int8), ("destination", np.int8),
+            ("turn", np.int8), ("action", np.int8), ("spawn_step", np.int64),
+            ("stopped_ticks", np.int64), ("route", np.int64),
+            ("index", np.int64)]
+
+  # Constructor
+  def __init__(self, model, capacity = 64):
+    self.model = model
+    self.size = 0
+    self.capacity = 0
+    self.resize(capacity)
+
+    # Tablas de rutas del cruce, indexadas por (ruta, índice)
+    self.routes = model.geometry.route_tables()
+
+    # Arreglo auxiliar por celda para buscar carros detenidos. Empieza en
+    # ceros y se regresa a ceros después de usarse, así que solo ocupa
+    # memoria en las celdas por donde pasan carros
+    self.scratch = np.zeros(model.m * model.n, dtype=np.int64)
+
+  # Cambia la capacidad de todas las columnas conservando los datos
+  def resize(self, capacity):
+    for name, dtype in self.FIELDS:
+      column = np.zeros(capacity, dtype=dtype)
+      if self.capacity: column[:self.size] = getattr(self, name)[:self.size]
+      setattr(self, name, column)
+    self.capacity = capacity
+
+  # Agrega un carro recién aparecido, equivalente al constructor de Car
+  def add(self, id, origin, destination, pos):
+    if self.size == self.capacity: self.resize(2 * self.capacity)
+    i = self.size
+    o = DIRECTIONS.index(origin)
+    self.id[i] = id
+    self.x[i], self.y[i] = pos
+    self.last_x[i], self.last_y[i] = pos
+    self.next_x[i], self.next_y[i] = -1, -1
+    self.dx[i], self.dy[i] = ORIGIN_DX[o], ORIGIN_DY[o]
+    self.state[i] = 1
+    self.origin[i] = o
+    self.destination[i] = DIRECTIONS.index(destination)
+    self.turn[i] = TURNS.index(self.model.directions[origin][destination])
+    self.action[i] = ACTIONS.index("spawned")
+    self.spawn_step[i] = self.model.schedule.steps
+    self.stopped_ticks[i] = 0
+    self.route[i] = o * len(DIRECTIONS) + self.destination[i]
+    self.index[i] = self.model.routes[(origin, destination)].index[pos]
+    self.model.car_count[pos] += 1
+    if self.model.heatmap is not None: self.model.heatmap.car_entered(pos)
+    self.size += 1
+
+  # Índices de los carros detenidos en cada celda, reducidos con el operador
+  # dado y consultados en las celdas de destino. Vacío donde no hay ninguno
+  def stopped_lookup(self, cells, stopped, targets, reducer):
+    k = np.flatnonzero(stopped)
+    scratch = self.scratch
+
+    # Ambos operadores se guardan como máximos positivos sobre ceros: k + 1
+    # para el máximo y len(cells) - k para el mínimo
+    if reducer is np.maximum:
+      np.maximum.at(scratch, cells[k], k + 1)
+      found = scratch[targets] - 1
+    else:
+      np.maximum.at(scratch, cells[k], len(cells) - k)
+      found = scratch[targets]
+      found = np.where(found > 0, len(cells) - found, np.iinfo(np.int64).max)
+    scratch[cells[k]] = 0
+    return found
+
+  # Definición de los cambios de todos los carros, como Car.step
+  def step(self):
+    n = self.size
+    if n == 0: return
+    model = self.model
+    routes = self.routes
+    x, y = self.x[:n], self.y[:n]
+    dx, dy = self.dx[:n], self.dy[:n]
+    route, index = self.route[:n], self.index[:n]
+    state = self.state[:n]
+    old_state = state.copy()
+
+    # Una vez retrasada la destrucción (para que Unity la note), se lleva a cabo
+    dying = old_state == -1
+    state[dying] = -2
+    active = ~dying
+    self.last_x[:n][active] = x[active]
+    self.last_y[:n][active] = y[active]
+
+    # Sistema de vueltas, el desplazamiento ya viene en la ruta
+    dx[active] = routes["dx"][route[active], index[active]]
+    dy[active] = routes["dy"][route[active], index[active]]
+
+    # Siguiente posición posible y destrucción de los que salen del modelo
+    # desde la última celda de su ruta
+    destination = self.destination[:n]
+    future_x = routes["x"][route, index + 1]
+    future_y = routes["y"][route, index + 1]
+    out = active & (index == routes["last"][route])
+    state[out] = -1
+    self.action[:n][out] = ACTIONS.index("destroyed")
+    if out.any():
+      exits = [(DIRECTIONS[d], id, DIRECTIONS[o], spawn_step, stopped)
+               for d, id, o, spawn_step, stopped in zip(destination[out].tolist(),
+                 self.id[:n][out].tolist(), self.origin[:n][out].tolist(),
+                 self.spawn_step[:n][out].tolist(),
+                 self.stopped_ticks[:n][out].tolist())]
+      model.exited.extend(exits)
+      if model.kpis is not None:
+        for _, _, origin, spawn_step, stopped in exits:
+          model.kpis.car_finished(origin, model.schedule.steps - spawn_step,
+                                  stopped)
+
+    # Carros que pasan por la máquina de estados
+    idx = np.flatnonzero(active & ~out)
+    if idx.size == 0: return
+    targets = future_x[idx] * model.n + future_y[idx]
+    cells = x * model.n + y
+
+    # Semáforo rojo en las líneas de pararse, el que rige es el opuesto
+    green = np.array([model.stoplights_by_id[d].state == "green"
+                      for d in DIRECTIONS])
+    red = (routes["stops"][route[idx], index[idx]] &
+           ~green[routes["light"][route[idx]]])
+
+    # Como los agentes se activan en orden, un carro ve el estado nuevo de los
+    # carros con menor id y el anterior de los de mayor id. Los de mayor id
+    # detenidos se conocen desde el inicio
+    blocked_after = self.stopped_lookup(cells, old_state == 0, targets,
+                                        np.maximum) > idx
+
+    # Sea cual sea su estado previo, un carro queda detenido si ve rojo o si
+    # enfrente hay un carro detenido, así que solo falta propagar por la fila
+    # el estado de los carros de menor id. Se sigue al carro de menor id de
+    # la celda de enfrente duplicando el salto en cada ronda
+    stopped = red | blocked_after
+    in_play = np.zeros(n, dtype=bool)
+    in_play[idx] = True
+    first = self.stopped_lookup(cells, in_play, targets, np.minimum)
+    ahead = np.where(first < idx, np.searchsorted(idx, first), -1)
+    while (ahead >= 0).any():
+      linked = ahead >= 0
+      stopped[linked] |= stopped[ahead[linked]]
+      ahead = np.where(linked, ahead[np.maximum(ahead, 0)], -1)
+
+    # Celdas con más de un carro delante requieren rondas extra, solo para
+    # los carros cuya celda de enfrente tuvo cambios
+    pending = np.arange(idx.size)
+    while pending.size:
+      state[idx] = np.where(stopped, 0, 1)
+      blocked_before = self.stopped_lookup(cells, state == 0, targets[pending],
+                                           np.minimum)
+      new_stopped = stopped[pending] | (blocked_before < idx[pending])
+      changed = pending[new_stopped != stopped[pending]]
+      if changed.size == 0: break
+      stopped[changed] = True
+      pending = np.flatnonzero(np.isin(targets, cells[idx[changed]]))
+
+    # Solo guarda el desplazamiento si la máquina anterior así lo dice
+    moving = state[idx] == 1
+    self.next_x[:n][idx[moving]] = future_x[idx[moving]]
+    self.next_y[:n][idx[moving]] = future_y[idx[moving]]
+
+  # Aplicación de los cambios de todos los carros, como Car.advance
+  def advance(self):
+    n = self.size
+    if n == 0: return
+    count = self.model.car_count
+    x, y = self.x[:n], self.y[:n]
+    route, index = self.route[:n], self.index[:n]
+    state = self.state[:n]
+    action = self.action[:n]
+
+    # Mueve a los carros avanzando, también en el conteo por celda
+    moving = state == 1
+    kpis = self.model.kpis
+    if kpis is not None:
+      # Carros que dejan la línea de pararse, contados por su semáforo
+      crossing = moving & self.routes["stops"][route, index]
+      lights = self.routes["light"][route[crossing]]
+      for light, count_crossing in enumerate(np.bincount(lights,
+                                                         minlength = 4).tolist()):
+        if count_crossing:
+          kpis.cars_discharged(DIRECTIONS[light], count_crossing)
+    heatmap = self.model.heatmap
+    gone = state == -2
+    if heatmap is not None:
+      # Carros que cambian de celda, se detienen, arrancan o se destruyen
+      was_stopped = action == ACTIONS.index("stopped")
+      started = moving & was_stopped
+      stopping = (state == 0) & ~was_stopped
+      leaving = moving | gone
+      cells = x * self.model.n + y
+      heatmap.cars_changed(cells[leaving],
+        self.next_x[:n][moving] * self.model.n + self.next_y[:n][moving],
+        cells[stopping], cells[started])
+    np.subtract.at(count, (x[moving], y[moving]), 1)
+    x[moving] = self.next_x[:n][moving]
+    y[moving] = self.next_y[:n][moving]
+    np.add.at(count, (x[moving], y[moving]), 1)
+    index[moving] += 1
+    action[moving] = np.where(self.routes["turning"][route[moving], index[moving]],
+      ACTIONS.index("turning"), ACTIONS.index("moving"))
+    action[state == 0] = ACTIONS.index("stopped")
+    self.stopped_ticks[:n][state == 0] += 1
+
+    # Destruye a los carros marcados, conservando el orden de los demás
+    if gone.any():
+      np.subtract.at(count, (x[gone], y[gone]), 1)
+      keep = np.flatnonzero(~gone)
+      for name, _ in self.FIELDS:
+        column = getattr(self, name)
+        column[:keep.size] = column[:n][keep]
+      self.size = keep.size
+
+  # True si todos los carros están detenidos y lo seguirán mientras no
+  # cambie nada en el cruce, como Car.stays_stopped
+  def frozen(self):
+    n = self.size
+    if n == 0: return True
+    routes = self.routes
+    state = self.state[:n]
+    route, index = self.route[:n], self.index[:n]
+    if (state != 0).any() or (index == routes["last"][route]).any(): return False
+    green = np.array([self.model.stoplights_by_id[d].state == "green"
+                      for d in DIRECTIONS])
+    red = routes["stops"][route, index] & ~green[routes["light"][route]]
+    blocked = self.model.car_count[routes["x"][route, index + 1],
+                                   routes["y"][route, index + 1]] > 0
+    return bool((red | blocked).all())
+
+  # Posiciones (x, y) ocupadas y cuántos carros hay en cada una
+  def occupied_cells(self):
+    n = self.size
+    cells, counts = np.unique(self.x[:n] * self.model.n + self.y[:n],
+                              return_counts = True)
+    return cells // self.model.n, cells % self.model.n, counts
+
+  # Columnas de los carros vivos, como CrossroadModel.report_columns
+  def columns(self):
+    n = self.size
+    return {"id": self.id[:n].copy(), "x1": self.last_x[:n].copy(),
+            "y1": self.last_y[:n].copy(), "x2": self.x[:n].copy(),
+            "y2": self.y[:n].copy(), "origin": self.origin[:n].copy(),
+            "action": self.action[:n].copy(), "turn": self.turn[:n].copy()}
+
+  # Lista de carros con el mismo formato de CrossroadModel.report_actions
+  def report(self):
+    n = self.size
+    columns = zip(self.id[:n].tolist(), self.last_x[:n].tolist(),
+                  self.last_y[:n].tolist(), self.x[:n].tolist(),
+                  self.y[:n].tolist(), self.origin[:n].tolist(),
+                  self.action[:n].tolist(), self.turn[:n].tolist())
+    return [{"id": id, "x1": x1, "y1": y1, "x2": x2, "y2": y2,
+             "origin": DIRECTIONS[origin], "action": ACTIONS[action],
+             "turn": TURNS[turn]}
+            for id, x1, y1, x2, y2, origin, action, turn in columns]
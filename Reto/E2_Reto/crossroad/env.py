@@ -0,0 +1,147 @@
+# Entornos vectorizados para entrenar controladores de semáforos
+
+# Paquete matemático utilizado para matrices de declaración sencilla
+import numpy as np
+
+# Nativo de Python para repartir los entornos en procesos
+import multiprocessing
+
+from .engine import DIRECTIONS, LIGHT_STATES
+from .model import CrossroadModel
+
+#@title Entornos vectorizados para entrenar controladores
+
+# Cruces independientes que avanzan juntos dentro de un mismo proceso. Cada
+# entorno tiene su propia semilla por episodio y se reinicia al terminar
+class CrossroadEnvGroup:
+  # Constructor
+  def __init__(self, indices, model_params, horizon, engine, seed):
+    self.indices = indices
+    self.model_params = model_params
+    self.horizon = horizon
+    self.engine = engine
+    self.seed = seed
+    self.episodes = {i: 0 for i in indices}
+    self.models = {}
+
+  # Crea el modelo de un nuevo episodio del entorno dado
+  def reset_env(self, i):
+    seed = (None if self.seed is None else
+            f"{self.seed}-{i}-{self.episodes[i]}")
+    self.episodes[i] += 1
+    model = CrossroadModel(*self.model_params, COLLECT_FRAMES = False,
+                           ENGINE = self.engine, seed = seed)
+    model.light_request = DIRECTIONS[0]
+    self.models[i] = model
+
+    # Celdas que observan los semáforos, en el orden de DIRECTIONS
+    self.preview_x, self.preview_y = np.array(
+      [model.stoplights_by_id[dir].previewed_cells for dir in DIRECTIONS]).T
+    return model
+
+  # Reinicia todos los entornos y devuelve sus observaciones
+  def reset(self):
+    for i in self.indices: self.reset_env(i)
+    return self.observe()
+
+  # Filas por semáforo y estado de cada semáforo de todos los entornos
+  def observe(self):
+    queues = np.empty((len(self.indices), len(DIRECTIONS)), dtype=np.int32)
+    lights = np.empty((len(self.indices), len(DIRECTIONS)), dtype=np.uint8)
+    for row, i in enumerate(self.indices):
+      model = self.models[i]
+      queues[row] = model.car_count[self.preview_x, self.preview_y].sum(axis = 0)
+      lights[row] = [LIGHT_STATES.index(model.stoplights_by_id[dir].state)
+                     for dir in DIRECTIONS]
+    return queues, lights
+
+  # Aplica una acción por entorno, un índice de DIRECTIONS con el semáforo que
+  # debe estar en verde, y avanza un tick. La recompensa es menos la fila
+  # total tras el tick. Los entornos que llegan al horizonte se reinician y
+  # regresan la observación de su nuevo episodio
+  def step(self, actions):
+    dones = np.zeros(len(self.indices), dtype=bool)
+    for row, i in enumerate(self.indices):
+      model = self.models[i]
+      model.light_request = DIRECTIONS[actions[row]]
+      model.step()
+      dones[row] = model.schedule.steps >= self.horizon
+    queues, lights = self.observe()
+    rewards = -queues.sum(axis = 1).astype(np.float32)
+    for row in np.flatnonzero(dones).tolist():
+      self.reset_env(self.indices[row])
+    if dones.any():
+      queues, lights = self.observe()
+    return queues, lights, rewards, dones
+
+# Ciclo de comandos de un proceso que simula un grupo de entornos
+def _env_group_worker(conn, group):
+  while True:
+    command, payload = conn.recv()
+    if command == "reset":
+      conn.send(group.reset())
+    elif command == "step":
+      conn.send(group.step(payload))
+    else:
+      break
+  conn.close()
+
+# B cruces independientes con la interfaz step/reset de un entorno
+# vectorizado. Las observaciones son arreglos (B, 4) con la fila que ve cada
+# semáforo y el índice de su estado en LIGHT_STATES, en el orden de
+# DIRECTIONS. Con PROCESSES > 1 los entornos se reparten en procesos
+class CrossroadVecEnv:
+  # Constructor
+  def __init__(self, B, M, N, SPAWN_RATE, LIGHT_TICK, horizon = 500,
+               PROCESSES = 1, ENGINE = "arrays", seed = None):
+    self.num_envs = B
+    self.horizon = horizon
+    model_params = [M, N, SPAWN_RATE, LIGHT_TICK, False, None]
+
+    # Grupos contiguos de entornos, uno por proceso
+    size = -(-B // PROCESSES)
+    groups = [list(range(start, min(start + size, B)))
+              for start in range(0, B, size)]
+    self.group_sizes = [len(group) for group in groups]
+
+    # Con un solo grupo se simula en este proceso, sin Pipes
+    self.group = (CrossroadEnvGroup(groups[0], model_params, horizon, ENGINE,
+                                    seed) if len(groups) == 1 else None)
+    self.workers = []
+    if self.group is None:
+      for indices in groups:
+        group = CrossroadEnvGroup(indices, model_params, horizon, ENGINE, seed)
+        parent_conn, child_conn = multiprocessing.Pipe()
+        worker = multiprocessing.Process(target = _env_group_worker,
+          args = (child_conn, group), daemon = True)
+        worker.start()
+        self.workers.append((worker, parent_conn))
+
+  # Envía un comando a todos los grupos y une sus resultados por entorno
+  def broadcast(self, command, payloads):
+    if self.group is not None:
+      results = [getattr(self.group, command)(*payloads[0])]
+    else:
+      for (_, conn), payload in zip(self.workers, payloads):
+        conn.send((command, payload[0] if payload else None))
+      results = [conn.recv() for _, conn in self.workers]
+    return tuple(np.concatenate(parts) for parts in zip(*results))
+
+  # Reinicia todos los entornos. Devuelve (queues, lights)
+  def reset(self):
+    return self.broadcast("reset", [()] * len(self.group_sizes))
+
+  # Avanza todos los entornos un tick con una acción por entorno. Devuelve
+  # (queues, lights, rewards, dones)
+  def step(self, actions):
+    actions = np.asarray(actions)
+    bounds = np.cumsum([0] + self.group_sizes)
+    return self.broadcast("step", [(actions[start:end],)
+                                   for start, end in zip(bounds, bounds[1:])])
+
+  # Termina los procesos de los grupos, si los hay
+  def close(self):
+    for worker, conn in self.workers:
+      conn.send(("close", None))
+      worker.join()
+    self.workers = []
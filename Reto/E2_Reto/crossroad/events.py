@@ -0,0 +1,195 @@
+# Eventos de carros y semáforos guardados por columnas para análisis
+
+# Paquete matemático utilizado para matrices de declaración sencilla
+import numpy as np
+
+# Nativos de Python para los metadatos y archivos de los eventos
+import json
+import os
+import time
+
+from .engine import ACTIONS, DIRECTIONS, LIGHT_STATES, TURNS
+
+#@title Grabación de eventos por columnas
+
+# Columnas de cada tipo de evento con su tipo de dato. Un evento de carro es
+# un cambio de acción (aparecer, avanzar, dar vuelta, detenerse o salir) con
+# la celda en que quedó; uno de semáforo es un cambio de estado. tick es la
+# cantidad de steps completados del modelo, como spawn_step de los carros
+EVENT_COLUMNS = {
+  "cars": [("tick", "<i8"), ("id", "<i8"), ("event", "u1"), ("x", "<i4"),
+           ("y", "<i4"), ("origin", "u1"), ("turn", "u1")],
+  "lights": [("tick", "<i8"), ("light", "u1"), ("state", "u1"),
+             ("previous", "u1")]}
+
+# Escribe los eventos de una corrida en bloques de columnas comprimidos de
+# NumPy (un .npz por bloque y tipo de evento) mientras corre la simulación.
+# Los eventos se juntan en memoria hasta chunk_rows filas y se escriben de
+# una vez. Los metadatos en JSON traen los parámetros, el motor, la semilla
+# y los bloques escritos, y se actualizan con cada bloque. Si path ya tiene
+# eventos se continúan, como al retomar una corrida desde un checkpoint: los
+# bloques siguen numerándose y con el primer step se descartan los eventos
+# de ese tick en adelante, que ya no pasaron
+class EventRecorder:
+  # Constructor, meta agrega datos propios de la corrida a los metadatos
+  def __init__(self, path, model, chunk_rows = 65536, meta = None):
+    self.path = path
+    self.chunk_rows = chunk_rows
+    demand = (type(model.arrival_schedule.demand).__name__
+              if model.arrival_schedule is not None else None)
+    self.meta = {"m": model.m, "n": model.n, "params": list(model.params),
+                 "engine": model.engine, "seed": model.seed, "demand": demand,
+                 "created": time.time(),
+                 "lights": [s.id for s in model.stoplights],
+                 "names": {"event": ACTIONS, "origin": DIRECTIONS,
+                           "turn": TURNS, "state": LIGHT_STATES},
+                 "chunks": {kind: 0 for kind in EVENT_COLUMNS},
+                 "rows": {kind: 0 for kind in EVENT_COLUMNS},
+                 **(meta or {})}
+    if os.path.exists(path + ".events.json"):
+      with open(path + ".events.json") as meta_file: previous = json.load(meta_file)
+      self.meta["chunks"] = previous["chunks"]
+      self.meta["rows"] = previous["rows"]
+    self.truncated = False
+    self.write_meta()
+
+    # Eventos pendientes de escribir por tipo, como lotes de columnas
+    self.buffers = {kind: [] for kind in EVENT_COLUMNS}
+    self.buffered = {kind: 0 for kind in EVENT_COLUMNS}
+
+    # Ids y acciones de los carros y estados de los semáforos del último step
+    self.track(model)
+
+  # Toma los carros y semáforos actuales del modelo como el último step, por
+  # ejemplo después de restaurarlo, para que el siguiente solo agregue cambios
+  def track(self, model):
+    cars, lights = model.report_columns()
+    self.ids, self.actions = cars["id"], cars["action"]
+    self.lights = lights
+
+  # Descarta los eventos escritos del tick dado en adelante. Los bloques van
+  # en orden de tick, así que se revisan desde el último
+  def truncate(self, tick):
+    for kind in EVENT_COLUMNS:
+      while self.meta["chunks"][kind]:
+        chunk_path = f"{self.path}.{kind}.{self.meta['chunks'][kind] - 1:05d}.npz"
+        with np.load(chunk_path) as arrays:
+          columns = {name: arrays[name] for name in arrays.files}
+        keep = columns["tick"] < tick
+        if keep.all(): break
+        self.meta["rows"][kind] -= int((~keep).sum())
+        if keep.any():
+          np.savez_compressed(chunk_path, **{name: column[keep]
+                                             for name, column in columns.items()})
+          break
+        os.remove(chunk_path)
+        self.meta["chunks"][kind] -= 1
+    self.write_meta()
+
+  # Agrega los eventos del último step: carros nuevos o que cambiaron de
+  # acción y semáforos que cambiaron de estado. Los carros vienen en orden de
+  # id, así que se empatan con los del step anterior por búsqueda binaria
+  def append(self, model):
+    cars, lights = model.report_columns()
+    tick = model.schedule.steps
+    if not(self.truncated):
+      self.truncate(tick)
+      self.truncated = True
+    ids, actions = cars["id"], cars["action"]
+    previous = np.full(ids.size, -1, dtype=np.int64)
+    if self.ids.size:
+      found = np.minimum(np.searchsorted(self.ids, ids), self.ids.size - 1)
+      known = self.ids[found] == ids
+      previous[known] = self.actions[found[known]]
+    changed = np.flatnonzero(actions != previous)
+    if changed.size:
+      self.add("cars", {"tick": np.full(changed.size, tick), "id": ids[changed],
+                        "event": actions[changed], "x": cars["x2"][changed],
+                        "y": cars["y2"][changed],
+                        "origin": cars["origin"][changed],
+                        "turn": cars["turn"][changed]})
+    self.ids, self.actions = ids, actions
+
+    switched = np.flatnonzero(lights != self.lights)
+    if switched.size:
+      self.add("lights", {"tick": np.full(switched.size, tick),
+                          "light": switched, "state": lights[switched],
+                          "previous": self.lights[switched]})
+    self.lights = lights
+
+  # Agrega un lote de eventos y escribe un bloque si ya hay suficientes
+  def add(self, kind, columns):
+    self.buffers[kind].append(columns)
+    self.buffered[kind] += len(columns["tick"])
+    if self.buffered[kind] >= self.chunk_rows: self.write_chunk(kind)
+
+  # Escribe a disco los eventos pendientes del tipo dado como un bloque
+  def write_chunk(self, kind):
+    if not(self.buffered[kind]): return
+    batches = self.buffers[kind]
+    columns = {name: np.concatenate([batch[name] for batch in batches]).astype(dtype)
+               for name, dtype in EVENT_COLUMNS[kind]}
+    chunk = self.meta["chunks"][kind]
+    np.savez_compressed(f"{self.path}.{kind}.{chunk:05d}.npz", **columns)
+    self.meta["chunks"][kind] += 1
+    self.meta["rows"][kind] += self.buffered[kind]
+    self.buffers[kind] = []
+    self.buffered[kind] = 0
+    self.write_meta()
+
+  # Escribe los metadatos a un temporal y lo renombra, así siempre son legibles
+  def write_meta(self):
+    temporary = self.path + ".events.json.tmp"
+    with open(temporary, "w") as meta_file: json.dump(self.meta, meta_file)
+    os.replace(temporary, self.path + ".events.json")
+
+  # Escribe lo pendiente; los eventos quedan legibles hasta este step
+  def flush(self):
+    for kind in EVENT_COLUMNS: self.write_chunk(kind)
+
+  # Escribe lo pendiente al terminar la corrida
+  def close(self):
+    self.flush()
+
+#@title Lectura de eventos
+
+# Eventos escritos por EventRecorder. Cada columna se lee de los bloques
+# solo cuando se pide, así que un análisis carga únicamente lo que usa
+class EventLog:
+  # Constructor
+  def __init__(self, path):
+    self.path = path
+    with open(path + ".events.json") as meta_file: self.meta = json.load(meta_file)
+
+  # Columnas pedidas (todas por omisión) de los eventos del tipo dado,
+  # "cars" o "lights", unidas de todos los bloques
+  def columns(self, kind = "cars", names = None):
+    names = names or [name for name, _ in EVENT_COLUMNS[kind]]
+    parts = {name: [] for name in names}
+    for chunk in range(self.meta["chunks"][kind]):
+      with np.load(f"{self.path}.{kind}.{chunk:05d}.npz") as arrays:
+        for name in names: parts[name].append(arrays[name])
+    dtypes = dict(EVENT_COLUMNS[kind])
+    return {name: np.concatenate(parts[name]) if parts[name]
+            else np.zeros(0, dtype=dtypes[name]) for name in names}
+
+  # Eventos como DataFrame con los códigos traducidos a nombres. pandas se
+  # importa solo aquí
+  def to_frame(self, kind = "cars", names = None):
+    import pandas as pd
+    frame = pd.DataFrame(self.columns(kind, names))
+    labels = dict(self.meta["names"], previous = self.meta["names"]["state"],
+                  light = self.meta["lights"])
+    for column in frame.columns.intersection(list(labels)):
+      frame[column] = pd.Categorical.from_codes(frame[column], labels[column])
+    return frame
+
+# Une las mismas columnas de varias corridas, agregando la columna "run" con
+# el índice de cada corrida en paths
+def scan_events(paths, kind = "cars", names = None):
+  logs = [EventLog(path).columns(kind, names) for path in paths]
+  columns = {name: np.concatenate([log[name] for log in logs])
+             for name in logs[0]} if logs else {}
+  columns["run"] = np.repeat(np.arange(len(logs)),
+                             [len(next(iter(log.values()))) for log in logs])
+  return columns
@@ -0,0 +1,93 @@
+# Formato binario por deltas de los cuadros que se envían a Unity
+
+# Paquete matemático utilizado para matrices de declaración sencilla
+import numpy as np
+
+# Nativo de Python para el encabezado binario de cada cuadro
+import struct
+
+from .engine import ACTIONS, DIRECTIONS, LIGHT_STATES, TURNS
+
+#@title Codificación binaria de cuadros
+
+# Tipo de dato de cada columna de carros en el formato binario
+FRAME_COLUMNS = [("id", "<i4"), ("x1", "<i2"), ("y1", "<i2"), ("x2", "<i2"),
+                 ("y2", "<i2"), ("origin", "u1"), ("action", "u1"),
+                 ("turn", "u1")]
+
+# Encabezado: identificador, tipo de cuadro (0 completo, 1 delta), tick,
+# número de semáforos, de carros enviados y de carros eliminados
+FRAME_HEADER = struct.Struct("<4sBIHII")
+FRAME_MAGIC = b"CRF1"
+
+# Codifica los cuadros de un cliente en binario por columnas. Un cuadro
+# completo trae todos los carros; un delta solo los que aparecieron, se
+# movieron o cambiaron de acción, más los ids de los que desaparecieron
+class FrameEncoder:
+  # Constructor
+  def __init__(self, keyframe_interval = 100):
+    self.keyframe_interval = keyframe_interval
+    self.tick = 0
+    self.previous = None
+
+  # Obliga a que el siguiente cuadro sea completo, para resincronizar
+  def reset(self):
+    self.previous = None
+
+  # Codifica el estado actual del modelo según report_columns
+  def encode(self, cars, lights):
+    ids = cars["id"]
+    keyframe = (self.previous is None or
+                self.tick % self.keyframe_interval == 0)
+    if keyframe:
+      changed = np.ones(ids.size, dtype=bool)
+      removed = np.zeros(0, dtype=np.int64)
+    else:
+      # Los ids están ordenados, se alinean con los del cuadro anterior
+      old = self.previous
+      pos = np.searchsorted(old["id"], ids)
+      found = np.zeros(ids.size, dtype=bool)
+      inside = pos < old["id"].size
+      found[inside] = old["id"][pos[inside]] == ids[inside]
+      same = pos[found]
+      changed = ~found
+      changed[found] = ((old["x2"][same] != cars["x2"][found]) |
+                        (old["y2"][same] != cars["y2"][found]) |
+                        (old["action"][same] != cars["action"][found]))
+      removed = old["id"][~np.isin(old["id"], ids)]
+    self.previous = {key: cars[key] for key in ("id", "x2", "y2", "action")}
+
+    # Encabezado, semáforos, columnas de carros y carros eliminados
+    parts = [FRAME_HEADER.pack(FRAME_MAGIC, 0 if keyframe else 1, self.tick,
+                               lights.size, int(changed.sum()), removed.size),
+             lights.astype(np.uint8).tobytes()]
+    for name, dtype in FRAME_COLUMNS:
+      parts.append(cars[name][changed].astype(dtype).tobytes())
+    parts.append(removed.astype("<i4").tobytes())
+    self.tick += 1
+    return b"".join(parts)
+
+# Decodifica un cuadro binario a diccionarios con los mismos textos que
+# report_actions, útil para clientes en Python y para verificar
+def decode_frame(data):
+  magic, kind, tick, n_lights, n_cars, n_removed = \
+    FRAME_HEADER.unpack_from(data)
+  if magic != FRAME_MAGIC: raise ValueError("Cuadro binario inválido")
+  offset = FRAME_HEADER.size
+  lights = np.frombuffer(data, "u1", n_lights, offset)
+  offset += n_lights
+  columns = {}
+  for name, dtype in FRAME_COLUMNS:
+    columns[name] = np.frombuffer(data, dtype, n_cars, offset)
+    offset += columns[name].nbytes
+  removed = np.frombuffer(data, "<i4", n_removed, offset)
+
+  cars = [{"id": int(columns["id"][i]), "x1": int(columns["x1"][i]),
+           "y1": int(columns["y1"][i]), "x2": int(columns["x2"][i]),
+           "y2": int(columns["y2"][i]),
+           "origin": DIRECTIONS[columns["origin"][i]],
+           "action": ACTIONS[columns["action"][i]],
+           "turn": TURNS[columns["turn"][i]]} for i in range(n_cars)]
+  return {"keyframe": kind == 0, "tick": tick,
+          "lights": [LIGHT_STATES[state] for state in lights],
+          "cars": cars, "removed": removed.tolist()}
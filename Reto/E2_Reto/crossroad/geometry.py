@@ -0,0 +1,211 @@
+# Geometría del cruce compilada una vez por tamaño de cuadrícula
+
+# Paquete matemático utilizado para matrices de declaración sencilla
+import numpy as np
+
+# Nativo de Python para guardar la geometría de cada tamaño
+import functools
+
+from .collector import TERRAIN_CODES
+from .engine import DIRECTIONS, ORIGIN_DX, ORIGIN_DY
+
+#@title Rutas del cruce
+
+# Lado opuesto a cada uno: un carro que entra por un lado y sale por el
+# opuesto va derecho, y el semáforo que lo rige es el de ese lado
+OPPOSITES = {"North": "South", "West": "East", "South": "North",
+             "East": "West"}
+
+# Recorrido fijo de los carros de un origen a un destino. Para cada índice
+# guarda la celda, el desplazamiento con el que se sale de ella, si es la
+# línea de pararse y si al llegar a ella el carro va dando vuelta. Un carro
+# solo necesita su ruta y su índice; se sale del cruce desde el último
+class Route:
+  # Constructor: recorre las celdas con las mismas reglas de vuelta que
+  # seguía cada carro en los puntos de cruce
+  def __init__(self, geometry, origin, destination):
+    self.origin = origin
+    self.destination = destination
+    self.light = OPPOSITES[origin]
+
+    # Desplazamiento al llegar al cruce por cada destino, y en qué columna
+    # (eje 0) o fila (eje 1) de la calle se toma
+    v_road, h_road = geometry.v_road, geometry.h_road
+    turns = {"North": (0, v_road[1], (0, -1)), "West": (1, h_road[1], (1, 0)),
+             "South": (0, v_road[0], (0, 1)), "East": (1, h_road[0], (-1, 0))}
+    axis, line, turn_move = turns[destination]
+    straight = destination == OPPOSITES[origin]
+
+    o = DIRECTIONS.index(origin)
+    move = (int(ORIGIN_DX[o]), int(ORIGIN_DY[o]))
+    pos = geometry.spawns[origin]
+    cells, moves = [], []
+    while 0 <= pos[0] < geometry.m and 0 <= pos[1] < geometry.n:
+      if not(straight) and pos in geometry.cross_points and pos[axis] == line:
+        move = turn_move
+      cells.append(pos)
+      moves.append(move)
+      pos = (pos[0] + move[0], pos[1] + move[1])
+
+    self.cells = tuple(cells)
+    self.moves = tuple(moves)
+    self.stops = tuple(cell in geometry.stop_points for cell in cells)
+    self.turning = tuple(cell in geometry.cross_points or
+                         cell in geometry.continue_points for cell in cells)
+    self.last = len(cells) - 1
+
+    # Índice de cada celda, para retomar la ruta desde una posición
+    self.index = {cell: i for i, cell in enumerate(cells)}
+
+#@title Geometría del cruce
+
+# Calles, puntos importantes y capas estáticas de un cruce de M×N. Solo
+# depende del tamaño, así que todos los modelos del mismo tamaño comparten
+# una instancia y nada de esto se debe modificar
+class CrossroadGeometry:
+  # Constructor: define las calles, puntos de cruce, de detención, de salida
+  # del cruce, de colocación de los carros y de colocación de los semáforos
+  def __init__(self, m, n):
+    self.m = m
+    self.n = n
+
+    # Calle sobre el eje de "x" (en dos valores céntricos de "y")
+    self.h_road = (n // 2 - 1, n // 2)
+
+    # Calle sobre el eje de "y" (en dos valores céntricos de "x")
+    self.v_road = (m // 2 - 1, m // 2)
+
+    # Puntos críticos donde cruzan todos los carros
+    self.cross_points = frozenset((v,h) for v in self.v_road for h in self.h_road)
+
+    # Definición de los puntos para pararse por un semáforo
+    self.stop_points = frozenset({
+        (self.v_road[0], self.h_road[0] - 1), # North
+        (self.v_road[1] + 1, self.h_road[0]), # West
+        (self.v_road[1], self.h_road[1] + 1), # South
+        (self.v_road[0] - 1, self.h_road[1]) # East
+    })
+
+    # Puntos donde se sale del cruce
+    self.continue_points = frozenset({
+        (self.v_road[1], self.h_road[0] - 1), # North
+        (self.v_road[1] + 1, self.h_road[1]), # West
+        (self.v_road[0], self.h_road[1] + 1), # South
+        (self.v_road[0] - 1, self.h_road[0])  # East
+    })
+
+    # Puntos de aparición de los carros
+    self.spawns = {
+        "North": (self.v_road[0], 0),
+        "West": (m - 1, self.h_road[0]),
+        "South": (self.v_road[1], n - 1),
+        "East": (0, self.h_road[1])
+    }
+
+    # Puntos para colocar los semáforos
+    self.stoplight_pos = {
+        "North": (self.v_road[1] + 1, self.h_road[0] - 1),
+        "West": (self.v_road[1] + 1, self.h_road[1] + 1),
+        "South": (self.v_road[0] - 1, self.h_road[1] + 1),
+        "East": (self.v_road[0] - 1, self.h_road[0] - 1)
+    }
+
+    # Capas y rutas que se calculan la primera vez que se piden
+    self._terrain_layer = None
+    self._routes = None
+    self._route_tables = None
+
+  # Capa estática del terreno, transpuesta como las cuadrículas animadas.
+  # Cada tipo se pinta sobre el anterior en orden de prioridad
+  def terrain_layer(self):
+    if self._terrain_layer is None:
+      layer = np.full((self.n, self.m), TERRAIN_CODES["garden"], dtype=np.uint8)
+      curb_rows = [h for h in (self.h_road[0] - 1, self.h_road[1] + 1)
+                   if 0 <= h < self.n]
+      curb_columns = [v for v in (self.v_road[0] - 1, self.v_road[1] + 1)
+                      if 0 <= v < self.m]
+      layer[curb_rows, :] = TERRAIN_CODES["curb"]
+      layer[:, curb_columns] = TERRAIN_CODES["curb"]
+      layer[list(self.h_road), :] = TERRAIN_CODES["street"]
+      layer[:, list(self.v_road)] = TERRAIN_CODES["street"]
+      for x, y in self.stop_points | self.continue_points:
+        layer[y, x] = TERRAIN_CODES["crosswalk"]
+      for x, y in self.cross_points:
+        layer[y, x] = TERRAIN_CODES["crossroad"]
+      layer.setflags(write = False)
+      self._terrain_layer = layer
+    return self._terrain_layer
+
+  # Ruta de cada par (origen, destino) con lados distintos
+  def routes(self):
+    if self._routes is None:
+      self._routes = {(origin, destination): Route(self, origin, destination)
+                      for origin in DIRECTIONS for destination in DIRECTIONS
+                      if origin != destination}
+    return self._routes
+
+  # Las rutas como tablas de NumPy para el motor vectorizado. La fila de
+  # cada ruta es origen * 4 + destino en el orden de DIRECTIONS y las
+  # columnas son índices de la ruta, con una columna de relleno para poder
+  # pedir la celda siguiente a la última. Devuelve un diccionario con las
+  # tablas x, y, dx, dy, stops y turning, el último índice de cada ruta
+  # (last) y el semáforo que la rige como índice de DIRECTIONS (light)
+  def route_tables(self):
+    if self._route_tables is None:
+      size = len(DIRECTIONS) ** 2
+      width = max(len(route.cells) for route in self.routes().values()) + 1
+      tables = {name: np.zeros((size, width), dtype=dtype) for name, dtype in
+                (("x", np.int64), ("y", np.int64), ("dx", np.int64),
+                 ("dy", np.int64), ("stops", bool), ("turning", bool))}
+      tables["last"] = np.zeros(size, dtype=np.int64)
+      tables["light"] = np.zeros(size, dtype=np.int64)
+      for (origin, destination), route in self.routes().items():
+        row = DIRECTIONS.index(origin) * len(DIRECTIONS) + DIRECTIONS.index(destination)
+        length = len(route.cells)
+        tables["x"][row, :length], tables["y"][row, :length] = np.array(route.cells).T
+        tables["dx"][row, :length], tables["dy"][row, :length] = np.array(route.moves).T
+        tables["stops"][row, :length] = route.stops
+        tables["turning"][row, :length] = route.turning
+        tables["last"][row] = route.last
+        tables["light"][row] = DIRECTIONS.index(route.light)
+      for table in tables.values(): table.setflags(write = False)
+      self._route_tables = tables
+    return self._route_tables
+
+# Geometría compartida del cruce de M×N
+@functools.lru_cache(maxsize = None)
+def get_geometry(M, N):
+  return CrossroadGeometry(M, N)
+
+#@title Cuadrícula dispersa
+
+# Cuadrícula con la parte de la interfaz de MultiGrid que usa el modelo. Solo
+# guarda las celdas que tienen agentes, así que construirla no cuesta nada y
+# su memoria depende de la cantidad de carros y no del tamaño
+class SparseGrid:
+  # Constructor
+  def __init__(self, width, height):
+    self.width = width
+    self.height = height
+    self.cells = {}
+
+  # True si la posición queda fuera de la cuadrícula
+  def out_of_bounds(self, pos):
+    return not(0 <= pos[0] < self.width and 0 <= pos[1] < self.height)
+
+  # Coloca a un agente en la celda dada
+  def place_agent(self, agent, pos):
+    self.cells.setdefault(pos, []).append(agent)
+    agent.pos = pos
+
+  # Quita a un agente de su celda
+  def remove_agent(self, agent):
+    cell = self.cells[agent.pos]
+    cell.remove(agent)
+    if not(cell): del self.cells[agent.pos]
+    agent.pos = None
+
+  # Mueve a un agente de su celda a la dada
+  def move_agent(self, agent, pos):
+    self.remove_agent(agent)
+    self.place_agent(agent, pos)
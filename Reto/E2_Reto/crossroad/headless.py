@@ -0,0 +1,90 @@
+# Ejecuciones sin servidor y barridos de parámetros en varios procesos
+
+# Nativos de Python para medir la duración y correr en varios procesos
+import multiprocessing
+import os
+import time
+
+from .model import CrossroadModel, load_checkpoint, save_checkpoint
+
+#@title Ejecución sin servidor
+
+# Avanza un modelo una cantidad fija de steps sin servidor ni Unity y
+# devuelve las métricas de tráfico de la ejecución. Con fast_forward los
+# tramos sin cambios se saltan de golpe, con las mismas métricas. Con
+# events_path los eventos de carros y semáforos se graban por columnas, y con
+# heatmap_path los mapas de calor por celda se guardan al terminar en
+# ventanas de heatmap_window ticks
+def run_headless(model_params, steps, seed = None, engine = "agents",
+                 checkpoint_path = None, checkpoint_every = 1000, demand = None,
+                 fast_forward = False, events_path = None, heatmap_path = None,
+                 heatmap_window = 3600):
+  M, N, SPAWN_RATE, LIGHT_TICK, SMART = model_params
+  heatmap = heatmap_window if heatmap_path is not None else None
+
+  # Con un checkpoint previo se continúa desde donde se quedó la corrida
+  if checkpoint_path is not None and os.path.exists(checkpoint_path):
+    model = load_checkpoint(checkpoint_path, ENGINE = engine,
+                            EVENTS_PATH = events_path, HEATMAP = heatmap)
+  else:
+    model = CrossroadModel(M, N, SPAWN_RATE, LIGHT_TICK, SMART, None,
+                           COLLECT_FRAMES = False, ENGINE = engine, KPIS = True,
+                           DEMAND = demand, EVENTS_PATH = events_path,
+                           HEATMAP = heatmap, seed = seed)
+
+  start_time = time.time()
+  while model.schedule.steps < steps:
+    # Los saltos no pasan del siguiente checkpoint
+    limit = min(steps, model.schedule.steps + checkpoint_every -
+                model.schedule.steps % checkpoint_every) - model.schedule.steps
+    if not(fast_forward) or not(model.skip_idle(limit)):
+      model.step()
+    if (checkpoint_path is not None and
+        model.schedule.steps % checkpoint_every == 0):
+      save_checkpoint(model, checkpoint_path)
+  wall_time = time.time() - start_time
+  if model.event_recorder is not None: model.event_recorder.close()
+  if model.heatmap is not None: model.heatmap.save(heatmap_path)
+
+  # Las esperas son los ticks detenidos de los carros que terminaron y la
+  # fila es la suma de las celdas que observan todos los semáforos
+  kpis = model.kpis.summary()
+  return {"M": M, "N": N, "SPAWN_RATE": SPAWN_RATE,
+          "LIGHT_TICK": LIGHT_TICK, "SMART": SMART, "seed": seed,
+          "engine": engine, "fast_forward": fast_forward,
+          "steps": steps, "cars_spawned": model.cars_spawned,
+          "cars_finished": kpis["cars_finished"],
+          "throughput": kpis["cars_finished"] / steps if steps else 0.0,
+          "mean_wait": kpis["stopped_time"]["mean"],
+          "max_wait": kpis["stopped_time"]["max"],
+          "mean_travel": kpis["travel_time"]["mean"],
+          "mean_queue": kpis["total_queue"]["mean"],
+          "max_queue": kpis["total_queue"]["max"],
+          "wall_time": wall_time}
+
+# Auxiliar para que el pool de procesos reciba un solo argumento
+def _run_headless_job(job):
+  return run_headless(*job)
+
+# Ejecuta cada configuración (M, N, SPAWN_RATE, LIGHT_TICK, SMART) con cada
+# semilla en un pool de procesos. Devuelve una tabla con una fila por corrida.
+# Una cuadrícula completa se arma con itertools.product de cada parámetro.
+# Con un perfil de demanda todas las configuraciones ven las mismas llegadas
+# por semilla, así las diferencias se deben solo a los parámetros. Con
+# events_dir cada corrida graba sus eventos como "run<fila>" en esa carpeta.
+# pandas se importa solo aquí para que los procesos del pool no lo carguen
+def parameter_sweep(configs, steps, seeds = (0,), processes = None,
+                    engine = "agents", demand = None, fast_forward = False,
+                    events_dir = None):
+  import pandas as pd
+  runs = [(tuple(config), seed) for config in configs for seed in seeds]
+  jobs = [(config, steps, seed, engine, None, 1000, demand, fast_forward,
+           os.path.join(events_dir, f"run{i}") if events_dir is not None
+           else None)
+          for i, (config, seed) in enumerate(runs)]
+  if processes == 1:
+    rows = [_run_headless_job(job) for job in jobs]
+  else:
+    with multiprocessing.Pool(processes) as pool:
+      rows = pool.map(_run_headless_job, jobs)
+  return pd.DataFrame(rows)
@@ -0,0 +1,142 @@
+# Mapas de calor por celda que se acumulan durante la simulación
+
+# Paquete matemático utilizado para matrices de declaración sencilla
+import numpy as np
+
+#@title Mapas de calor por celda
+
+# Nombres de los acumuladores por celda: ticks-carro de ocupación, ticks que
+# pasaron carros detenidos en la celda y carros que entraron a ella
+HEATMAP_LAYERS = ["occupancy", "stopped", "passes"]
+
+# Acumuladores de M×N por celda que los carros actualizan al moverse, al
+# detenerse y al arrancar, sin recorrer la cuadrícula en cada tick. Cada
+# celda recuerda cuántos carros (y cuántos detenidos) tiene y desde qué
+# tick; al cambiar se suman esos carros por los ticks transcurridos, así los
+# ticks sin cambios, incluso los que salta skip_idle, no cuestan nada. Los
+# cambios de un carro a la vez se juntan y se aplican por lotes al cerrar el
+# tick, que cuenta el estado de la cuadrícula al terminarlo. Con window > 0
+# cada window ticks se guarda una ventana con lo acumulado en ella. Por
+# dentro las celdas van aplanadas como x * N + y; lo exportado se indexa
+# [x, y] como car_count, y las cuadrículas animadas son su traspuesta
+class CellHeatmap:
+  # Constructor, start es el tick en que empieza la acumulación
+  def __init__(self, m, n, window = 0, start = 0):
+    self.m = m
+    self.n = n
+    self.window = window
+    self.tick = start
+
+    # Carros y carros detenidos en cada celda, y tick desde el que los tiene
+    self.cars = np.zeros(m * n, dtype=np.int64)
+    self.stopped_cars = np.zeros(m * n, dtype=np.int64)
+    self.since = np.full(m * n, start, dtype=np.int64)
+
+    # Celdas aplanadas de los cambios del tick en curso aún sin aplicar
+    self.left, self.entered, self.stopped, self.started = [], [], [], []
+
+    # Acumulado de la ventana en curso y de las ventanas ya cerradas
+    self.current = {layer: np.zeros(m * n, dtype=np.int64)
+                    for layer in HEATMAP_LAYERS}
+    self.closed = {layer: np.zeros(m * n, dtype=np.int64)
+                   for layer in HEATMAP_LAYERS}
+    self.window_ends = []
+    self.windows = {layer: [] for layer in HEATMAP_LAYERS}
+
+  # Un carro entró a la celda dada, al aparecer o al avanzar
+  def car_entered(self, pos):
+    self.entered.append(pos[0] * self.n + pos[1])
+
+  # Un carro dejó la celda dada, al avanzar o al destruirse
+  def car_left(self, pos):
+    self.left.append(pos[0] * self.n + pos[1])
+
+  # Un carro se detuvo en la celda dada
+  def car_stopped(self, pos):
+    self.stopped.append(pos[0] * self.n + pos[1])
+
+  # Un carro detenido arrancó desde la celda dada
+  def car_started(self, pos):
+    self.started.append(pos[0] * self.n + pos[1])
+
+  # Aplica los cambios pendientes de un carro a la vez
+  def apply_pending(self):
+    pending = (self.left, self.entered, self.stopped, self.started)
+    if not(any(pending)): return
+    self.cars_changed(*[np.array(cells, dtype=np.int64) for cells in pending])
+    self.left, self.entered, self.stopped, self.started = [], [], [], []
+
+  # Cambios por lotes, como arreglos de celdas aplanadas que se pueden
+  # repetir: carros que dejaron, entraron, se detuvieron y arrancaron
+  def cars_changed(self, left, entered, stopped, started):
+    cells = np.concatenate((left, entered, stopped, started))
+    elapsed = self.tick - self.since[cells]
+    self.current["occupancy"][cells] += self.cars[cells] * elapsed
+    self.current["stopped"][cells] += self.stopped_cars[cells] * elapsed
+    self.since[cells] = self.tick
+    np.subtract.at(self.cars, left, 1)
+    np.add.at(self.cars, entered, 1)
+    np.add.at(self.current["passes"], entered, 1)
+    np.add.at(self.stopped_cars, stopped, 1)
+    np.subtract.at(self.stopped_cars, started, 1)
+
+  # Carros que ya estaban en la cuadrícula al empezar, sin contarlos como
+  # entradas. x y y son arreglos y stopped marca a los detenidos
+  def place(self, x, y, stopped):
+    cells = x * self.n + y
+    np.add.at(self.cars, cells, 1)
+    np.add.at(self.stopped_cars, cells[stopped], 1)
+
+  # Suma a todas las celdas los ticks pendientes hasta el tick actual
+  def flush(self):
+    self.apply_pending()
+    elapsed = self.tick - self.since
+    self.current["occupancy"] += self.cars * elapsed
+    self.current["stopped"] += self.stopped_cars * elapsed
+    self.since[:] = self.tick
+
+  # Cierre de un tick del modelo
+  def end_tick(self):
+    self.apply_pending()
+    self.tick += 1
+    if self.window and self.tick % self.window == 0: self.close_window()
+
+  # Ticks que el modelo saltó sin cambios, cerrando las ventanas que terminan
+  # dentro del salto
+  def skip_ticks(self, ticks):
+    end = self.tick + ticks
+    if self.window:
+      for boundary in range(self.tick - self.tick % self.window + self.window,
+                            end + 1, self.window):
+        self.tick = boundary
+        self.close_window()
+    self.tick = end
+
+  # Guarda lo acumulado desde la ventana anterior y empieza una nueva
+  def close_window(self):
+    self.flush()
+    self.window_ends.append(self.tick)
+    for layer in HEATMAP_LAYERS:
+      self.windows[layer].append(self.current[layer].reshape(self.m, self.n).copy())
+      self.closed[layer] += self.current[layer]
+      self.current[layer][:] = 0
+
+  # Acumulado de toda la corrida hasta el tick actual por capa, de M×N
+  def totals(self):
+    self.flush()
+    return {layer: (self.closed[layer] + self.current[layer]).reshape(self.m, self.n)
+            for layer in HEATMAP_LAYERS}
+
+  # Ventanas cerradas como arreglos de (ventanas, M, N) por capa, con el
+  # tick en que terminó cada una en "tick", y los totales como "total_<capa>"
+  def arrays(self):
+    arrays = {"tick": np.array(self.window_ends, dtype=np.int64)}
+    for layer, total in self.totals().items():
+      arrays[layer] = (np.stack(self.windows[layer]) if self.windows[layer]
+                       else np.zeros((0, self.m, self.n), dtype=np.int64))
+      arrays["total_" + layer] = total
+    return arrays
+
+  # Escribe las ventanas y los totales en un .npz comprimido
+  def save(self, path):
+    np.savez_compressed(path, window = self.window, **self.arrays())
@@ -0,0 +1,102 @@
+# Indicadores de tráfico que se actualizan durante la simulación
+
+from .engine import DIRECTIONS
+
+#@title Indicadores de tráfico
+
+# Conteo, suma, suma de cuadrados y máximo de una serie de valores. Cada
+# actualización es O(1) y no guarda los valores
+class RunningStat:
+  # Constructor
+  def __init__(self):
+    self.count = 0
+    self.sum = 0
+    self.sum_squares = 0
+    self.max = 0
+
+  # Agrega un valor a la serie, repetido count veces
+  def add(self, value, count = 1):
+    self.count += count
+    self.sum += value * count
+    self.sum_squares += value * value * count
+    if value > self.max: self.max = value
+
+  # Media, desviación estándar y máximo de la serie
+  def summary(self):
+    if self.count == 0: return {"count": 0, "mean": 0.0, "std": 0.0, "max": 0}
+    mean = self.sum / self.count
+    variance = max(0.0, self.sum_squares / self.count - mean * mean)
+    return {"count": self.count, "mean": mean, "std": variance ** 0.5,
+            "max": self.max}
+
+# Indicadores de tráfico que los carros y semáforos actualizan al cambiar de
+# estado: tiempos de recorrido y de espera por origen, filas por semáforo,
+# carros que cruzan por fase en verde y throughput por semáforo
+class TrafficKPIs:
+  # Constructor
+  def __init__(self):
+    self.ticks = 0
+    self.travel_time = {dir: RunningStat() for dir in DIRECTIONS}
+    self.stopped_time = {dir: RunningStat() for dir in DIRECTIONS}
+    self.queue = {dir: RunningStat() for dir in DIRECTIONS}
+    self.total_queue = RunningStat()
+    self.tick_queue = 0
+    self.discharged = {dir: 0 for dir in DIRECTIONS}
+    self.phase_discharged = {dir: 0 for dir in DIRECTIONS}
+    self.discharged_per_phase = {dir: RunningStat() for dir in DIRECTIONS}
+
+  # Un carro salió del cruce con su tiempo de recorrido y detenido, en ticks
+  def car_finished(self, origin, travel_time, stopped_time):
+    self.travel_time[origin].add(travel_time)
+    self.stopped_time[origin].add(stopped_time)
+
+  # Carros que dejaron la línea de pararse del semáforo dado
+  def cars_discharged(self, light_id, count = 1):
+    self.discharged[light_id] += count
+    self.phase_discharged[light_id] += count
+
+  # Fila observada por un semáforo en este tick
+  def queue_sample(self, light_id, cars_waiting):
+    self.queue[light_id].add(cars_waiting)
+    self.tick_queue += cars_waiting
+
+  # Un semáforo volvió a rojo, se cierra el conteo de su fase
+  def phase_ended(self, light_id):
+    self.discharged_per_phase[light_id].add(self.phase_discharged[light_id])
+    self.phase_discharged[light_id] = 0
+
+  # Cierre de un tick del modelo
+  def end_tick(self):
+    self.total_queue.add(self.tick_queue)
+    self.tick_queue = 0
+    self.ticks += 1
+
+  # Ticks que el modelo saltó sin cambios, con la misma fila observada por
+  # cada semáforo en todos ellos
+  def skip_ticks(self, queues, ticks):
+    for light_id, cars_waiting in queues.items():
+      self.queue[light_id].add(cars_waiting, ticks)
+    self.total_queue.add(sum(queues.values()), ticks)
+    self.ticks += ticks
+
+  # Resumen de todos los indicadores, agregando también los totales
+  def summary(self):
+    travel, stopped = RunningStat(), RunningStat()
+    for dir in DIRECTIONS:
+      for total, stat in ((travel, self.travel_time[dir]),
+                          (stopped, self.stopped_time[dir])):
+        total.count += stat.count
+        total.sum += stat.sum
+        total.sum_squares += stat.sum_squares
+        total.max = max(total.max, stat.max)
+    return {"ticks": self.ticks, "cars_finished": travel.count,
+            "travel_time": travel.summary(), "stopped_time": stopped.summary(),
+            "total_queue": self.total_queue.summary(),
+            "by_origin": {dir: {"travel_time": self.travel_time[dir].summary(),
+                                "stopped_time": self.stopped_time[dir].summary()}
+                          for dir in DIRECTIONS},
+            "by_stoplight": {dir: {"queue": self.queue[dir].summary(),
+              "discharged": self.discharged[dir],
+              "throughput": self.discharged[dir] / self.ticks if self.ticks else 0.0,
+              "discharged_per_phase": self.discharged_per_phase[dir].summary()}
+                             for dir in DIRECTIONS}}
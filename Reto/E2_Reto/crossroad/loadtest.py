@@ -0,0 +1,204 @@
+# Prueba de carga del servidor con muchos clientes como el de Unity
+
+# Nativos de Python para los clientes HTTP en hilos y procesos
+from http.server import ThreadingHTTPServer
+import http.client
+import multiprocessing
+import os
+import socket
+import threading
+import json
+import time
+
+from .bench import latency_stats
+from .server import SimulationServer, attach_model, attach_sessions
+
+#@title Clientes de prueba
+
+# Cliente que sigue el mismo saludo que Unity ("board-init", "lights-init") y
+# luego pide cuadros a requests_per_second (0 es lo más rápido posible) por
+# duration segundos o hasta recibir "stop". Con session manda su propio id de
+# sesión en cada POST. Registra la latencia de cada request y sus errores
+class LoadClient:
+  # Constructor
+  def __init__(self, host, port, duration, requests_per_second = 0,
+               request = "step", steps = 1, session = None, timeout = 5.0,
+               stall_seconds = 1.0):
+    self.host = host
+    self.port = port
+    self.duration = duration
+    self.period = 1 / requests_per_second if requests_per_second > 0 else 0
+    self.request = request
+    self.steps = steps
+    self.session = session
+    self.timeout = timeout
+    self.stall_seconds = stall_seconds
+    self.connection = None
+
+    # Resultados: latencias por request, errores por tipo y requests lentos
+    self.latencies = {}
+    self.errors = {}
+    self.stalls = []
+    self.orders = {}
+
+  # Envía un POST y devuelve el cuerpo, o None si falló. Un error cierra la
+  # conexión para que el siguiente request abra otra
+  def post(self, request):
+    body = {"request": request}
+    if request == "step-n": body["steps"] = self.steps
+    if self.session is not None: body["session"] = self.session
+    start = time.perf_counter()
+    try:
+      if self.connection is None:
+        self.connection = http.client.HTTPConnection(self.host, self.port,
+                                                     timeout = self.timeout)
+      self.connection.request("POST", "/", json.dumps(body))
+      response = self.connection.getresponse()
+      data = response.read()
+    except (OSError, http.client.HTTPException) as error:
+      kind = ("timeout" if isinstance(error, socket.timeout) else
+              type(error).__name__)
+      self.errors[kind] = self.errors.get(kind, 0) + 1
+      if kind == "timeout": self.stalls.append((request, self.timeout))
+      if self.connection is not None: self.connection.close()
+      self.connection = None
+      return None
+    seconds = time.perf_counter() - start
+    if response.status != 200:
+      kind = f"HTTP {response.status}"
+      self.errors[kind] = self.errors.get(kind, 0) + 1
+      return None
+    self.latencies.setdefault(request, []).append(seconds)
+    if seconds >= self.stall_seconds: self.stalls.append((request, seconds))
+    return data
+
+  # Orden del servidor en la respuesta ("wait", "stop", "full"), o None
+  def order(self, data):
+    if data is None or not(data.startswith(b"{\"order\"")): return None
+    order = json.loads(data)["order"]
+    self.orders[order] = self.orders.get(order, 0) + 1
+    return order
+
+  # Saludo y ciclo de requests del cliente
+  def run(self):
+    end = time.time() + self.duration
+    for request in ("board-init", "lights-init"):
+      if self.order(self.post(request)) in ("stop", "full"): return self.close()
+    next_time = time.time()
+    while time.time() < end:
+      if self.order(self.post(self.request)) in ("stop", "full"): break
+      next_time += self.period
+      time.sleep(max(0, next_time - time.time()))
+    return self.close()
+
+  # Cierra la conexión y cierra la sesión propia en el servidor
+  def close(self):
+    if self.session is not None: self.post("session-close")
+    if self.connection is not None: self.connection.close()
+    return {"latencies": self.latencies, "errors": self.errors,
+            "stalls": self.stalls, "orders": self.orders}
+
+# Corre un grupo de clientes en hilos de un mismo proceso
+def _client_group(clients):
+  results = [None] * len(clients)
+  def run_client(i):
+    results[i] = LoadClient(**clients[i]).run()
+  threads = [threading.Thread(target = run_client, args = (i,))
+             for i in range(len(clients))]
+  for thread in threads: thread.start()
+  for thread in threads: thread.join()
+  return results
+
+#@title Prueba de carga
+
+# Corre clients clientes contra un servidor ya levantado, repartidos en
+# processes procesos para que sus hilos no compitan con el servidor por el
+# GIL. Con sessions cada cliente usa su propia sesión. Devuelve el
+# throughput, las latencias p50/p99 por request, la tasa de errores y los
+# requests que tardaron más de stall_seconds o no respondieron
+def run_load_test(port, host = "127.0.0.1", clients = 8, duration = 10.0,
+                  requests_per_second = 0, request = "step", steps = 1,
+                  sessions = False, timeout = 5.0, stall_seconds = 1.0,
+                  processes = None):
+  configs = [{"host": host, "port": port, "duration": duration,
+              "requests_per_second": requests_per_second, "request": request,
+              "steps": steps, "session": f"load-{i}" if sessions else None,
+              "timeout": timeout, "stall_seconds": stall_seconds}
+             for i in range(clients)]
+  processes = min(clients, processes or os.cpu_count() or 1)
+  groups = [configs[i::processes] for i in range(processes)]
+  start = time.perf_counter()
+  with multiprocessing.Pool(processes) as pool:
+    results = [result for group in pool.map(_client_group, groups)
+               for result in group]
+  wall_time = time.perf_counter() - start
+
+  # Une los resultados de todos los clientes
+  latencies, errors, orders, stalls = {}, {}, {}, []
+  for result in results:
+    for name, values in result["latencies"].items():
+      latencies.setdefault(name, []).extend(values)
+    for totals, counts in ((errors, result["errors"]), (orders, result["orders"])):
+      for name, count in counts.items(): totals[name] = totals.get(name, 0) + count
+    stalls += result["stalls"]
+  answered = sum(len(values) for values in latencies.values())
+  failed = sum(errors.values())
+  frames = len(latencies.get(request, []))
+  return {"clients": clients, "processes": processes, "duration": duration,
+          "requests_per_second": requests_per_second, "request": request,
+          "sessions": sessions, "wall_time": wall_time,
+          "requests": answered + failed,
+          "throughput": answered / wall_time if wall_time else 0.0,
+          "frames_per_second": frames * (steps if request == "step-n" else 1)
+                               / wall_time if wall_time else 0.0,
+          "error_rate": failed / (answered + failed) if answered + failed else 0.0,
+          "errors": errors, "orders": orders,
+          "latency": {name: {**latency_stats(values), "count": len(values)}
+                      for name, values in sorted(latencies.items())},
+          "stalls": len(stalls),
+          "max_stall_seconds": max((seconds for _, seconds in stalls),
+                                   default = 0.0),
+          "stalled_requests": sorted({name for name, _ in stalls}),
+          "ok": not(stalls) and not(failed)}
+
+# Levanta un SimulationServer local en un puerto libre, le corre la prueba de
+# carga y lo apaga. Con session_processes las sesiones se atienden en ese
+# número de procesos (0 en el del servidor) y cada cliente usa la suya; sin
+# él todos comparten el modelo del servidor. También revisa que el servidor
+# se apague en menos de stall_seconds, como lo pide el "stop" del modelo
+def load_test_local(model_params, session_processes = None, max_sessions = 64,
+                    engine = "agents", **options):
+  model_params = list(model_params)
+  attach_model(SimulationServer, model_params, COLLECT_FRAMES = False,
+               ENGINE = engine)
+  if session_processes is not None:
+    attach_sessions(SimulationServer, model_params, session_processes,
+                    max_sessions, ENGINE = engine)
+  SimulationServer.start_time = time.time()
+  httpd = ThreadingHTTPServer(("127.0.0.1", 0), SimulationServer)
+  thread = threading.Thread(target = httpd.serve_forever, daemon = True)
+  thread.start()
+  try:
+    report = run_load_test(httpd.server_address[1],
+                           sessions = session_processes is not None, **options)
+  finally:
+    # El apagado se espera en otro hilo para notar si el servidor se trabó
+    start = time.perf_counter()
+    stopper = threading.Thread(target = httpd.shutdown, daemon = True)
+    stopper.start()
+    stopper.join(options.get("stall_seconds", 1.0))
+    shutdown_seconds = time.perf_counter() - start
+    shutdown_stalled = stopper.is_alive()
+    httpd.server_close()
+    if SimulationServer.sessions is not None:
+      SimulationServer.sessions.close()
+      SimulationServer.sessions = None
+    SimulationServer.initialized = False
+    SimulationServer.encoder = None
+  report.update({"M": model_params[0], "N": model_params[1],
+                 "SPAWN_RATE": model_params[2],
+                 "session_processes": session_processes,
+                 "shutdown_seconds": shutdown_seconds,
+                 "shutdown_stalled": shutdown_stalled,
+                 "ok": report["ok"] and not(shutdown_stalled)})
+  return report
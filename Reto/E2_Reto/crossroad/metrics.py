@@ -0,0 +1,126 @@
+# Métricas de latencia del modelo y del servidor en formato de Prometheus
+
+# Nativos de Python para medir y agrupar latencias
+import bisect
+import threading
+import time
+
+#@title Métricas del servidor
+
+# Estado del modelo que se expone en /metrics: carros, steps, filas por
+# semáforo y fila de activación. Se toma de una vez para que el texto no
+# mezcle ticks distintos
+def model_gauges(model):
+  return {"cars": int(model.car_count.sum()),
+          "cars_spawned": model.cars_spawned,
+          "steps": model.schedule.steps,
+          "queues": {stoplight.id: sum(model.cars_there(cell)
+                                       for cell in stoplight.previewed_cells)
+                     for stoplight in model.stoplights},
+          "activation_queue": len(model.activation_queue)}
+
+# Histograma de latencias con cubetas fijas que crecen al doble, desde 10µs.
+# Registrar una medición es O(log cubetas) y no guarda las mediciones
+class LatencyHistogram:
+  BUCKETS = [0.00001 * 2 ** i for i in range(22)]
+
+  # Constructor
+  def __init__(self):
+    self.counts = [0] * (len(self.BUCKETS) + 1)
+    self.sum = 0.0
+    self.count = 0
+
+  # Registra una medición en segundos
+  def observe(self, seconds):
+    self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+    self.sum += seconds
+    self.count += 1
+
+  # Estimación del cuantil q, interpolando dentro de su cubeta
+  def quantile(self, q):
+    if self.count == 0: return 0.0
+    target = q * self.count
+    seen = 0
+    for i, count in enumerate(self.counts):
+      if seen + count >= target and count:
+        lower = self.BUCKETS[i - 1] if i > 0 else 0.0
+        upper = self.BUCKETS[i] if i < len(self.BUCKETS) else lower * 2
+        return lower + (upper - lower) * (target - seen) / count
+      seen += count
+    return self.BUCKETS[-1]
+
+# Latencias por fase del modelo y por tipo de request. Se exportan en el
+# formato de texto de Prometheus junto con conteos del modelo
+class Metrics:
+  # Cuantiles que se reportan de cada histograma
+  QUANTILES = [0.5, 0.95, 0.99]
+
+  # Requests con histograma propio, cualquier otro se agrupa como "other"
+  # para que un cliente no pueda crear etiquetas sin límite
+  REQUESTS = {"board-init", "lights-init", "step", "step-n", "step-binary",
+              "seek"}
+
+  # Constructor. El candado permite registrar desde los hilos de las
+  # sesiones, que no toman el candado del servidor
+  def __init__(self):
+    self.histograms = {"phase": {}, "request": {}}
+    self.lock = threading.Lock()
+
+  # Registra una duración de la familia ("phase" o "request") y nombre dados
+  def observe(self, family, name, seconds):
+    with self.lock:
+      histograms = self.histograms[family]
+      if name not in histograms: histograms[name] = LatencyHistogram()
+      histograms[name].observe(seconds)
+
+  # Ejecuta una fase midiendo su duración
+  def time_phase(self, name, phase):
+    start = time.perf_counter()
+    phase()
+    self.observe("phase", name, time.perf_counter() - start)
+
+  # Texto para el endpoint /metrics con los histogramas y el estado del
+  # modelo tomado con model_gauges, si el servidor tiene uno
+  def render(self, gauges):
+    with self.lock:
+      lines = self.render_histograms()
+    if gauges is not None: lines += self.render_model(gauges)
+    return "\n".join(lines) + "\n"
+
+  # Líneas de los histogramas de fases y requests
+  def render_histograms(self):
+    lines = []
+    for family, label in (("phase", "phase"), ("request", "request")):
+      metric = f"crossroad_{family}_seconds"
+      lines.append(f"# HELP {metric} Latencia por {label}")
+      lines.append(f"# TYPE {metric} histogram")
+      for name, histogram in sorted(self.histograms[family].items()):
+        cumulative = 0
+        for bound, count in zip(histogram.BUCKETS + ["+Inf"], histogram.counts):
+          cumulative += count
+          lines.append(f'{metric}_bucket{{{label}="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_sum{{{label}="{name}"}} {histogram.sum}')
+        lines.append(f'{metric}_count{{{label}="{name}"}} {histogram.count}')
+      quantile_metric = f"crossroad_{family}_quantile_seconds"
+      lines.append(f"# TYPE {quantile_metric} gauge")
+      for name, histogram in sorted(self.histograms[family].items()):
+        for q in self.QUANTILES:
+          lines.append(f'{quantile_metric}{{{label}="{name}",quantile="{q}"}} '
+                       f'{histogram.quantile(q)}')
+    return lines
+
+  # Líneas del estado del modelo: carros, filas por semáforo y steps
+  def render_model(self, gauges):
+    lines = ["# TYPE crossroad_cars gauge"]
+    lines.append(f"crossroad_cars {gauges['cars']}")
+    lines.append("# TYPE crossroad_cars_spawned_total counter")
+    lines.append(f"crossroad_cars_spawned_total {gauges['cars_spawned']}")
+    lines.append("# TYPE crossroad_steps_total counter")
+    lines.append(f"crossroad_steps_total {gauges['steps']}")
+    lines.append("# TYPE crossroad_queue_length gauge")
+    for light_id, queue_length in gauges["queues"].items():
+      lines.append(f'crossroad_queue_length{{stoplight="{light_id}"}} '
+                   f'{queue_length}')
+    lines.append("# TYPE crossroad_activation_queue_length gauge")
+    lines.append(f"crossroad_activation_queue_length {gauges['activation_queue']}")
+    return lines
@@ -0,0 +1,577 @@
+# Modelo del cruce con sus snapshots y checkpoints
+
+# Paquete esencial que ayuda a modelar sistemas multiagentes
+from mesa import Model
+from mesa.time import SimultaneousActivation
+
+# Paquete matemático utilizado para matrices de declaración sencilla
+import numpy as np
+
+# Nativo de Python para aleatorizar la aparición de los carros
+import random
+
+# Nativos de Python para medir las fases del step
+import time
+
+# Nativo de Python para las filas de carros que esperan entrar
+import collections
+
+# Nativos de Python para copiar y guardar snapshots del modelo
+import copy
+import os
+import pickle
+
+from .agents import Car, Stoplight
+from .arrivals import ArrivalSchedule
+from .collector import GridCollector
+from .engine import ACTIONS, DIRECTIONS, LIGHT_STATES, TURNS, CarArrays
+from .events import EventRecorder
+from .geometry import SparseGrid, get_geometry
+from .heatmap import CellHeatmap
+from .kpis import TrafficKPIs
+from .scheduler import ActiveSetActivation
+from .trajectory import TrajectoryRecorder
+
+#@title Clase Modelo
+
+class CrossroadModel(Model):
+  # Constructor
+  def __init__(self, M, N, SPAWN_RATE, LIGHT_TICK, SMART, MAX_DURATION,
+               FRAME_LIMIT = None, DELTA_FRAMES = False, COLLECT_FRAMES = True,
+               ENGINE = "agents", RECORD_PATH = None, KPIS = False,
+               DEMAND = None, ACTIVE_SET = True, EVENTS_PATH = None,
+               HEATMAP = None, ID_OFFSET = 0, ID_STRIDE = 1, seed = None):
+    # Generador aleatorio propio del modelo, reproducible si se da una semilla
+    self.random = random.Random(seed)
+
+    # Parámetros, motor y semilla con los que se construyó, para restaurar
+    # snapshots y describir las corridas
+    self.params = [M, N, SPAWN_RATE, LIGHT_TICK, SMART, MAX_DURATION]
+    self.engine = ENGINE
+    self.seed = seed
+
+    # Inicialización de atributos para almacenar los datos recibidos
+    self.m = M
+    self.n = N
+    self.spawn_rate = SPAWN_RATE
+    self.smart = SMART
+    self.max_duration = MAX_DURATION
+    self.cars_spawned = 0
+
+    # Los carros nuevos reciben cars_spawned * ID_STRIDE + ID_OFFSET como id.
+    # Una ciudad da a cada cruce su propio desplazamiento para que los ids
+    # no se repitan entre cruces
+    self.id_offset = ID_OFFSET
+    self.id_stride = ID_STRIDE
+    
+    # Cuadrícula que permite tener más de un agente por celda. Solo guarda
+    # las celdas ocupadas; el terreno es una capa estática aparte
+    self.grid = SparseGrid(self.m, self.n)
+
+    # Permite activar al mismo tiempo todos los componentes del modelo. Con
+    # el conjunto activo los carros detenidos se saltan hasta que algo cambie
+    # para ellos; el resultado es el mismo que activar a todos
+    self.active_set = ACTIVE_SET and ENGINE == "agents"
+    self.schedule = (ActiveSetActivation(self) if self.active_set
+                     else SimultaneousActivation(self))
+
+    # Recolector de datos para futura representación gráfica, con un límite
+    # opcional de cuadros y codificación por diferencias. Se puede omitir
+    # en ejecuciones sin animación
+    self.grid_collector = (GridCollector(FRAME_LIMIT, DELTA_FRAMES)
+                           if COLLECT_FRAMES else None)
+
+    # Obtención de los puntos importantes del modelo, que se almacenen
+    self.define_points()
+    self.define_directions()
+
+    # Probabilidad de aparición por lado y registros de los carros que
+    # esperan entrar por él desde un cruce vecino. Una ciudad los usa para
+    # conectar este cruce con sus vecinos; cada registro trae el id del carro
+    # y trips guarda los de los carros que siguen en el cruce
+    self.spawn_rates = {dir: SPAWN_RATE for dir in self.spawns}
+    self.arrivals = {dir: collections.deque() for dir in self.spawns}
+    self.trips = {}
+    self.spawn_keys = list(self.spawns)
+
+    # Con un perfil de demanda las llegadas se generan por adelantado y los
+    # carros que no caben esperan en la fila de su lado. Sin él se usa
+    # SPAWN_RATE tick por tick
+    self.arrival_schedule = (ArrivalSchedule(DEMAND, seed)
+                             if DEMAND is not None else None)
+    self.entry_queues = {dir: collections.deque() for dir in self.spawns}
+
+    # Carros que salieron del cruce durante el último step, como (lado de
+    # salida, id, origen, tick de aparición, ticks detenido)
+    self.exited = []
+
+    # Índice de ocupación de carros: conteo por celda y carros en cada celda.
+    # El conteo empieza en ceros, así que solo ocupa memoria donde hay carros
+    self.car_count = np.zeros((self.m, self.n), dtype=np.int32)
+    self.car_cells = {}
+
+    # Indicadores de tráfico que se actualizan mientras corre la simulación
+    self.kpis = TrafficKPIs() if KPIS else None
+
+    # Mapas de calor por celda, con HEATMAP como el largo de sus ventanas en
+    # ticks (0 para solo los totales). None no los acumula
+    self.heatmap = (CellHeatmap(self.m, self.n, HEATMAP)
+                    if HEATMAP is not None else None)
+
+    # Motor de los carros: "agents" usa un agente de Mesa por carro y
+    # "arrays" guarda a todos los carros en arreglos de NumPy
+    self.car_arrays = CarArrays(self) if ENGINE == "arrays" else None
+
+    # Definición y colocación de los semáforos
+    self.stoplights = [
+      Stoplight("North", self, "red", LIGHT_TICK, SMART),
+      Stoplight("West", self, "red", LIGHT_TICK, SMART),
+      Stoplight("South", self, "red", LIGHT_TICK, SMART),
+      Stoplight("East", self, "red", LIGHT_TICK, SMART)
+    ]
+    for stoplight in self.stoplights:
+      self.grid.place_agent(stoplight, stoplight.pos)
+      self.schedule.add(stoplight)
+    self.stoplights_by_id = {s.id: s for s in self.stoplights}
+    self.activation_queue = []
+
+    # Semáforo que pide un controlador externo, None usa la máquina propia
+    self.light_request = None
+
+    # Métricas de tiempo por fase, None para no medir nada
+    self.metrics = None
+
+    # Grabación opcional de cada step a un log en disco para repetirlo
+    self.recorder = (TrajectoryRecorder(RECORD_PATH, self)
+                     if RECORD_PATH is not None else None)
+
+    # Eventos de carros y semáforos por columnas para análisis, opcional
+    self.event_recorder = (EventRecorder(EVENTS_PATH, self)
+                           if EVENTS_PATH is not None else None)
+
+  # Unidad de cambio del modelo. También se llama a actuar a los agentes
+  def step(self):
+    self.exited = []
+    if self.metrics is None:
+      self.collect_grid()
+      self.step_agents()
+      self.spawn_cars()
+      self.record_step()
+    else:
+      # Con métricas activas se mide cada fase por separado
+      start = time.perf_counter()
+      self.metrics.time_phase("collect", self.collect_grid)
+      self.metrics.time_phase("schedule", self.step_agents)
+      self.metrics.time_phase("spawn", self.spawn_cars)
+      self.metrics.time_phase("record", self.record_step)
+      self.metrics.observe("phase", "step", time.perf_counter() - start)
+    if self.kpis is not None: self.kpis.end_tick()
+    if self.heatmap is not None: self.heatmap.end_tick()
+
+  # Ticks desde ahora en los que step() solo cambiaría contadores: los
+  # carros seguirán detenidos, ningún semáforo cambia de estado y no hay
+  # carros por entrar en un punto de aparición libre. 0 si el siguiente tick
+  # ya tiene un evento
+  def idle_ticks(self):
+    if self.light_request is not None: return 0
+    if self.car_arrays is not None:
+      if not(self.car_arrays.frozen()): return 0
+    elif self.active_set:
+      # Con el conjunto activo los carros detenidos ya están estacionados
+      if len(self.schedule.active) > len(self.stoplights): return 0
+    elif not(all(agent.stays_stopped() for agent in self.schedule.agents
+                 if isinstance(agent, Car))):
+      return 0
+    for dir in self.spawns:
+      if ((self.arrivals[dir] or self.entry_queues[dir]) and
+          not(self.cars_there(self.spawns[dir]))):
+        return 0
+    return min(stoplight.quiet_ticks() for stoplight in self.stoplights)
+
+  # Salta hasta limit ticks en los que solo cambiarían contadores, hasta el
+  # siguiente evento: una llegada, el fin de una fase de semáforo o un carro
+  # que puede avanzar. Los contadores, indicadores y cuadros quedan igual
+  # que con step(). Devuelve los ticks que avanzó, 0 si el siguiente tick se
+  # debe simular con step()
+  def skip_idle(self, limit):
+    ticks = min(self.idle_ticks(), limit)
+    start = self.schedule.steps
+
+    # Con calendario de llegadas y sin cuadros por tick se sabe cuándo llega
+    # el siguiente carro y se salta directo a ese tick
+    jump = (self.arrival_schedule is not None and self.grid_collector is None
+            and self.recorder is None)
+    if ticks and jump:
+      ticks = self.arrival_schedule.next_arrival(start, start + ticks) - start
+    if ticks == 0: return 0
+
+    # Estado que no cambia durante el salto
+    queues = {s.id: sum(self.cars_there(cell) for cell in s.previewed_cells)
+              for s in self.stoplights}
+    cars = ([] if self.car_arrays is not None or self.active_set else
+            [agent for agent in self.schedule.agents if isinstance(agent, Car)])
+    size = self.car_arrays.size if self.car_arrays is not None else 0
+    self.exited = []
+
+    if jump:
+      self.schedule.steps += ticks
+    else:
+      # Las llegadas se deciden tick por tick con el generador aleatorio y
+      # los cuadros se capturan por tick, así que solo se saltan las fases
+      # de los agentes. Al aparecer un carro termina el salto
+      for skipped in range(1, ticks + 1):
+        self.collect_grid()
+        self.schedule.steps += 1
+        spawned = self.cars_spawned
+        self.spawn_cars()
+        self.record_step()
+        if self.heatmap is not None: self.heatmap.end_tick()
+        if self.cars_spawned != spawned: break
+      ticks = skipped
+
+    # Contadores de los ticks saltados. Los carros estacionados del conjunto
+    # activo los cuentan solos al despertar
+    self.schedule.time += ticks
+    for stoplight in self.stoplights:
+      if stoplight.state != "red": stoplight.ticks_on += ticks
+    for car in cars: car.stopped_ticks += ticks
+    if size: self.car_arrays.stopped_ticks[:size] += ticks
+    if self.kpis is not None: self.kpis.skip_ticks(queues, ticks)
+    if self.heatmap is not None and jump: self.heatmap.skip_ticks(ticks)
+    return ticks
+
+  # Avanza hasta el tick dado. Con fast_forward los tramos sin cambios se
+  # saltan con skip_idle y los demás ticks se simulan con step()
+  def run_until(self, tick, fast_forward = True):
+    while self.schedule.steps < tick:
+      if not(fast_forward) or not(self.skip_idle(tick - self.schedule.steps)):
+        self.step()
+
+  # Captura la cuadrícula del instante actual si se recolectan cuadros
+  def collect_grid(self):
+    if self.grid_collector is not None: self.grid_collector.collect(self)
+
+  # Activa a semáforos y carros según el motor elegido
+  def step_agents(self):
+    if self.car_arrays is None:
+      self.schedule.step()
+    else:
+      # Mismo orden que SimultaneousActivation: semáforos y luego carros
+      for stoplight in self.stoplights: stoplight.step()
+      self.car_arrays.step()
+      for stoplight in self.stoplights: stoplight.advance()
+      self.car_arrays.advance()
+      self.schedule.steps += 1
+      self.schedule.time += 1
+
+  # Agrega el step al log de trayectorias y sus eventos si se están grabando
+  def record_step(self):
+    if self.recorder is not None: self.recorder.append(self)
+    if self.event_recorder is not None: self.event_recorder.append(self)
+  
+  # Toma las calles, puntos de cruce, de detención, de salida del cruce, de
+  # colocación de los carros y de los semáforos y las rutas de la geometría
+  # compartida por todos los modelos del mismo tamaño
+  def define_points(self):
+    self.geometry = get_geometry(self.m, self.n)
+    self.h_road = self.geometry.h_road
+    self.v_road = self.geometry.v_road
+    self.cross_points = self.geometry.cross_points
+    self.stop_points = self.geometry.stop_points
+    self.continue_points = self.geometry.continue_points
+    self.spawns = self.geometry.spawns
+    self.stoplight_pos = self.geometry.stoplight_pos
+    self.routes = self.geometry.routes()
+
+  # Capa estática del terreno, transpuesta como las cuadrículas animadas. Se
+  # calcula una sola vez por tamaño pues el terreno nunca cambia
+  @property
+  def terrain_layer(self):
+    return self.geometry.terrain_layer()
+
+  # Almacena en un diccionario la relación entre direcciones
+  def define_directions(self):
+    self.directions = {
+        "North": {"South": "straight", "East": "right", "West": "left"},
+        "West": {"East": "straight", "North": "right", "South": "left"},
+        "South": {"North": "straight", "West": "right", "East": "left"},
+        "East": {"West": "straight", "South": "right", "North": "left"}
+    }
+
+
+  # Estado completo del modelo en datos simples: columnas de los carros con el
+  # formato de CarArrays, semáforos, contadores y el estado del generador
+  # aleatorio. No incluye los cuadros recolectados ni la grabación
+  def snapshot(self):
+    if self.active_set: self.schedule.settle()
+    if self.car_arrays is not None:
+      n = self.car_arrays.size
+      cars = {name: getattr(self.car_arrays, name)[:n].copy()
+              for name, _ in CarArrays.FIELDS}
+    else:
+      agents = [agent for agent in self.schedule.agents if isinstance(agent, Car)]
+      cars = {name: np.zeros(len(agents), dtype=dtype)
+              for name, dtype in CarArrays.FIELDS}
+      for i, car in enumerate(agents):
+        next_pos = car.next_pos if car.next_pos is not None else (-1, -1)
+        for name, value in (("id", car.id), ("x", car.pos[0]), ("y", car.pos[1]),
+            ("dx", car.dx), ("dy", car.dy), ("last_x", car.last_pos[0]),
+            ("last_y", car.last_pos[1]), ("next_x", next_pos[0]),
+            ("next_y", next_pos[1]), ("state", car.state),
+            ("origin", DIRECTIONS.index(car.origin)),
+            ("destination", DIRECTIONS.index(car.destination)),
+            ("turn", TURNS.index(car.turn)), ("action", ACTIONS.index(car.action)),
+            ("spawn_step", car.spawn_step), ("stopped_ticks", car.stopped_ticks),
+            ("route", DIRECTIONS.index(car.origin) * len(DIRECTIONS) +
+                      DIRECTIONS.index(car.destination)),
+            ("index", car.index)):
+          cars[name][i] = value
+
+    return {"params": list(self.params), "engine": self.engine,
+            "steps": self.schedule.steps, "time": self.schedule.time,
+            "cars_spawned": self.cars_spawned,
+            "ids": (self.id_offset, self.id_stride),
+            "random": self.random.getstate(),
+            "lights": [(s.state, s.next_state, s.ticks_on) for s in self.stoplights],
+            "activation_queue": list(self.activation_queue),
+            "light_request": self.light_request,
+            "spawn_rates": dict(self.spawn_rates),
+            "arrivals": {dir: list(queue) for dir, queue in self.arrivals.items()},
+            "trips": copy.deepcopy(self.trips),
+            "arrival_schedule": copy.deepcopy(self.arrival_schedule),
+            "entry_queues": {dir: list(queue)
+                             for dir, queue in self.entry_queues.items()},
+            "kpis": copy.deepcopy(self.kpis),
+            "heatmap": copy.deepcopy(self.heatmap),
+            "cars": cars}
+
+  # Copia independiente del modelo en su estado actual, para probar qué
+  # pasaría con otras decisiones sin tocar al original
+  def fork(self, **options):
+    return restore_model(self.snapshot(), **options)
+
+  # Genera carros en los límites de la cuadrícula con un destino
+  def spawn_cars(self):
+    if self.arrival_schedule is not None:
+      self.spawn_scheduled()
+      return
+    for dir in self.spawns:
+      # Primero entran los carros que llegan de un cruce vecino
+      if self.arrivals[dir] and not(self.cars_there(self.spawns[dir])):
+        self.place_car(dir, trip = self.arrivals[dir].popleft())
+      # Considera también que no haya ya un carro ahí
+      elif (self.random.random() < self.spawn_rates[dir] and
+          not(self.cars_there(self.spawns[dir]))):
+        self.place_car(dir)
+
+  # Recorre el calendario de llegadas: los carros de este tick se forman en
+  # la fila de su lado y entra uno por lado si el punto de aparición está libre
+  def spawn_scheduled(self):
+    for origin, destination in self.arrival_schedule.arrivals(self.schedule.steps - 1):
+      self.entry_queues[DIRECTIONS[origin]].append(DIRECTIONS[destination])
+    for dir in self.spawns:
+      if self.cars_there(self.spawns[dir]): continue
+      # Primero entran los carros que llegan de un cruce vecino
+      if self.arrivals[dir]:
+        self.place_car(dir, trip = self.arrivals[dir].popleft())
+      elif self.entry_queues[dir]:
+        self.place_car(dir, self.entry_queues[dir].popleft())
+
+  # Coloca un carro nuevo en el punto de aparición de la dirección dada, con
+  # el destino dado o uno al azar. Un carro que llega de un cruce vecino
+  # conserva el id de su registro
+  def place_car(self, dir, other_dir = None, trip = None):
+    # Se elige una dirección de fin que no sea la misma
+    if other_dir is None:
+      other_dir = dir
+      while other_dir == dir: other_dir = self.random.choice(self.spawn_keys)
+
+    # Se coloca el carro creado con un id que se mantiene único
+    if trip is None:
+      car_id = self.cars_spawned * self.id_stride + self.id_offset
+    else:
+      car_id = trip["id"]
+      self.trips[car_id] = trip
+    if self.car_arrays is not None:
+      self.car_arrays.add(car_id, dir, other_dir, self.spawns[dir])
+    else:
+      new_car = Car(car_id, self, 1, dir, other_dir, self.spawns[dir])
+      self.grid.place_agent(new_car, new_car.pos)
+      self.add_to_index(new_car, new_car.pos)
+      self.schedule.add(new_car)
+    self.cars_spawned += 1
+  
+  # Función que elimina carros que hayan cumplido el recorrido
+  def destroy_car(self, car_instance):
+    self.remove_from_index(car_instance, car_instance.pos)
+    self.grid.remove_agent(car_instance)
+    self.schedule.remove(car_instance)
+
+  # Despierta a los carros estacionados en las celdas dadas
+  def wake_cars(self, cells):
+    for cell in cells:
+      for car in self.car_cells.get(cell, ()): self.schedule.wake(car)
+
+  # Despierta a los carros estacionados cuya siguiente celda es la dada
+  def wake_behind(self, pos):
+    for dx, dy in ((0, 1), (0, -1), (1, 0), (-1, 0)):
+      for car in self.car_cells.get((pos[0] - dx, pos[1] - dy), ()):
+        if car.dx == dx and car.dy == dy: self.schedule.wake(car)
+
+  # Registra a un carro en el índice de ocupación dentro de la celda dada
+  def add_to_index(self, car, pos):
+    if self.heatmap is not None: self.heatmap.car_entered(pos)
+    self.car_count[pos] += 1
+    self.car_cells.setdefault(pos, []).append(car)
+
+  # Quita a un carro del índice de ocupación de la celda dada
+  def remove_from_index(self, car, pos):
+    if self.heatmap is not None: self.heatmap.car_left(pos)
+    self.car_count[pos] -= 1
+    cars = self.car_cells[pos]
+    cars.remove(car)
+    if not(cars): del self.car_cells[pos]
+
+  # Devuelve un entero indicando cuantos carros hay en la posición elegida
+  def cars_there(self, pos):
+    # Consulta directa al índice de ocupación, sin revisar agentes
+    return int(self.car_count[pos])
+
+  # Función para registrar que un semáforo quiere activarse, aún si debe esperar
+  def ask_activation(self, light_id):
+    # Casos de activación directa, no hay otro semáforo activo o ya es turno de este
+    if len(self.activation_queue) == 0:
+      self.activation_queue.append(light_id)
+      return True
+    elif self.activation_queue[0] == light_id:
+      return True
+    # Dado que es probable que este semáforo ya estuviera en fila, se verifica
+    elif light_id not in self.activation_queue:
+      self.activation_queue.append(light_id)
+    return False
+
+  def report_actions(self):
+    if self.car_arrays is not None:
+      cars = self.car_arrays.report()
+      lights = [{"id": s.id, "state": s.state} for s in self.stoplights]
+      return {"Items": cars}, {"Items": lights}
+    cars = [{"id": c.id, "x1": c.last_pos[0], "y1": c.last_pos[1],
+      "x2": c.pos[0], "y2": c.pos[1], "origin": c.origin, "action": c.action,
+      "turn": c.turn} for c in self.schedule.agents if isinstance(c, Car)]   
+    lights = [{"id": s.id, "state": s.state} for s in self.stoplights]
+    return {"Items": cars}, {"Items": lights}
+
+  # Mismos datos de report_actions en columnas de NumPy, con los textos
+  # codificados como índices de DIRECTIONS, ACTIONS, TURNS y LIGHT_STATES
+  def report_columns(self):
+    if self.car_arrays is not None:
+      cars = self.car_arrays.columns()
+    else:
+      agents = [c for c in self.schedule.agents if isinstance(c, Car)]
+      cars = {"id": [c.id for c in agents],
+              "x1": [c.last_pos[0] for c in agents],
+              "y1": [c.last_pos[1] for c in agents],
+              "x2": [c.pos[0] for c in agents],
+              "y2": [c.pos[1] for c in agents],
+              "origin": [DIRECTIONS.index(c.origin) for c in agents],
+              "action": [ACTIONS.index(c.action) for c in agents],
+              "turn": [TURNS.index(c.turn) for c in agents]}
+      cars = {key: np.array(values, dtype=np.int64)
+              for key, values in cars.items()}
+    lights = np.array([LIGHT_STATES.index(s.state) for s in self.stoplights],
+                      dtype=np.uint8)
+    return cars, lights
+
+#@title Snapshots y checkpoints
+
+# Construye un modelo nuevo en el estado de un snapshot. Las opciones se pasan
+# al constructor, por ejemplo ENGINE para continuar con el otro motor
+def restore_model(snapshot, **options):
+  heatmap = snapshot.get("heatmap")
+  options = {"COLLECT_FRAMES": False, "ENGINE": snapshot["engine"],
+             "KPIS": snapshot["kpis"] is not None,
+             "HEATMAP": heatmap.window if heatmap is not None else None,
+             "ID_OFFSET": snapshot.get("ids", (0, 1))[0],
+             "ID_STRIDE": snapshot.get("ids", (0, 1))[1],
+             **options}
+  model = CrossroadModel(*snapshot["params"], **options)
+  model.schedule.steps = snapshot["steps"]
+  model.schedule.time = snapshot["time"]
+  model.cars_spawned = snapshot["cars_spawned"]
+  model.random.setstate(snapshot["random"])
+  for stoplight, (state, next_state, ticks_on) in zip(model.stoplights,
+                                                      snapshot["lights"]):
+    stoplight.state, stoplight.next_state = state, next_state
+    stoplight.ticks_on = ticks_on
+  model.activation_queue = list(snapshot["activation_queue"])
+  model.light_request = snapshot["light_request"]
+  model.spawn_rates = dict(snapshot["spawn_rates"])
+  # Los snapshots anteriores solo contaban las llegadas, siempre en cero
+  # fuera de una ciudad
+  model.arrivals = {dir: collections.deque(queue or ())
+                    for dir, queue in snapshot["arrivals"].items()}
+  model.trips = copy.deepcopy(snapshot.get("trips", {}))
+  model.arrival_schedule = copy.deepcopy(snapshot["arrival_schedule"])
+  model.entry_queues = {dir: collections.deque(queue)
+                        for dir, queue in snapshot["entry_queues"].items()}
+  if model.kpis is not None and snapshot["kpis"] is not None:
+    model.kpis = copy.deepcopy(snapshot["kpis"])
+
+  # Carros en orden de id, el mismo en el que los activa el scheduler
+  cars = snapshot["cars"]
+  n = len(cars["id"])
+  if model.car_arrays is not None:
+    model.car_arrays.resize(max(n, 64))
+    for name, _ in CarArrays.FIELDS:
+      getattr(model.car_arrays, name)[:n] = cars[name]
+    model.car_arrays.size = n
+    np.add.at(model.car_count, (cars["x"], cars["y"]), 1)
+  else:
+    for i in range(n):
+      pos = (int(cars["x"][i]), int(cars["y"][i]))
+      car = Car(int(cars["id"][i]), model, int(cars["state"][i]),
+                DIRECTIONS[cars["origin"][i]], DIRECTIONS[cars["destination"][i]],
+                pos)
+      car.last_pos = (int(cars["last_x"][i]), int(cars["last_y"][i]))
+      car.next_pos = ((int(cars["next_x"][i]), int(cars["next_y"][i]))
+                      if cars["next_x"][i] >= 0 else None)
+      car.dx, car.dy = int(cars["dx"][i]), int(cars["dy"][i])
+      car.action = ACTIONS[cars["action"][i]]
+      car.spawn_step = int(cars["spawn_step"][i])
+      car.stopped_ticks = int(cars["stopped_ticks"][i])
+      model.grid.place_agent(car, pos)
+      model.add_to_index(car, pos)
+      model.schedule.add(car)
+
+  # Los mapas de calor siguen desde el snapshot, o empiezan en este tick con
+  # los carros ya colocados sin contarlos como entradas
+  if model.heatmap is not None:
+    if snapshot.get("heatmap") is not None:
+      model.heatmap = copy.deepcopy(snapshot["heatmap"])
+    else:
+      model.heatmap = CellHeatmap(model.m, model.n, model.heatmap.window,
+                                  snapshot["steps"])
+      model.heatmap.place(cars["x"], cars["y"],
+                          cars["action"] == ACTIONS.index("stopped"))
+
+  # Los eventos continúan desde los carros y semáforos restaurados
+  if model.event_recorder is not None: model.event_recorder.track(model)
+  return model
+
+# Guarda un snapshot del modelo en disco. Se escribe a un archivo temporal y
+# se renombra, así un fallo a la mitad deja intacto el checkpoint anterior.
+# Antes se escriben las grabaciones pendientes: al reanudar, los eventos se
+# cortan en el tick del checkpoint y lo que siguiera en memoria se perdería
+def save_checkpoint(model, path):
+  if model.event_recorder is not None: model.event_recorder.flush()
+  if model.recorder is not None: model.recorder.flush()
+  temporary = path + ".tmp"
+  with open(temporary, "wb") as file:
+    pickle.dump(model.snapshot(), file, protocol = pickle.HIGHEST_PROTOCOL)
+  os.replace(temporary, path)
+
+# Restaura un modelo desde un checkpoint escrito por save_checkpoint. Usa
+# pickle, así que solo se deben cargar archivos propios
+def load_checkpoint(path, **options):
+  with open(path, "rb") as file:
+    return restore_model(pickle.load(file), **options)
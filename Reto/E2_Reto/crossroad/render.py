@@ -0,0 +1,122 @@
+# Animación en Colab y render de la simulación a video o GIF
+
+# Paquete matemático utilizado para matrices de declaración sencilla
+import numpy as np
+
+# Paquetes útiles para trabajar y graficar la animación de la simulación
+import matplotlib
+import matplotlib.pyplot as plt
+import matplotlib.animation as animation
+
+# Nativos de Python para recorrer los cuadros y enviarlos a ffmpeg
+import itertools
+import multiprocessing
+import subprocess
+
+from .trajectory import TrajectoryLog
+
+#@title Animación
+
+# Colores por mostrar, con una lista paralela para recordar lo que representan
+CROSSROAD_COLORS = ["#003264", "#E66414", "#191919", "#F8DE7E", "#646464",
+                    "#323232", "#00FF00", "#FFFF00", "#FF0000", "#60AA46"]
+CROSSROAD_LABELS = ["car", "crash", "crossroad", "crosswalk", "curb", "street",
+                    "green light", "yellow light", "red light", "garden"]
+
+# Los mismos colores como tabla RGB para rasterizar cuadrículas con NumPy
+CROSSROAD_PALETTE = np.array([[int(color[i:i + 2], 16) for i in (1, 3, 5)]
+                              for color in CROSSROAD_COLORS], dtype=np.uint8)
+
+# Genera una animación de un modelo que recolecta sus cuadrículas. Con stride
+# se muestra uno de cada tantos cuadros
+def animate_simulation(model, stride = 1):
+  # Recopila los datos del recolector por ser animados
+  grids = model.grid_collector
+  if grids is None or len(grids) == 0: return
+  
+  # Genera el mapa de color con matplotlib
+  crossroad_cmap = matplotlib.colors.ListedColormap(CROSSROAD_COLORS)
+  
+  # Modificación de parámetros de matplotlib para una impresión mejor
+  plt.rcParams["animation.html"] = "jshtml"
+  plt.rcParams["axes.titlesize"] = 28
+  matplotlib.rcParams['animation.embed_limit'] = 2 ** 128
+
+  # Construcción y personalización de la gráfica animada
+  fig, axs = plt.subplots(figsize=(7, 7))
+  axs.set_title("Crossroad Simulation")
+  axs.set_xticks([])
+  axs.set_yticks([])
+  patch = plt.imshow(grids[0], vmin = 0,
+    vmax = len(CROSSROAD_COLORS), cmap = crossroad_cmap)
+
+  # Creación y ejecución del objeto animación. Con blit solo se redibuja la
+  # imagen y los cuadros se recorren sin guardarse en caché
+  def update(frame):
+    patch.set_data(frame)
+    return [patch]
+  crossroad_simulation = animation.FuncAnimation(fig, update,
+    frames = itertools.islice(grids, 0, None, stride), blit = True,
+    cache_frame_data = False, save_count = -(-len(grids) // stride))
+  plt.show()
+
+#@title Render a archivo
+
+# Convierte una cuadrícula de códigos a una imagen RGB, reduciéndola tomando
+# una de cada downscale celdas por eje y dibujando cada celda restante como
+# un cuadro de cell_size × cell_size pixeles
+def rasterize_grid(grid, downscale = 1, cell_size = 1):
+  image = CROSSROAD_PALETTE[grid[::downscale, ::downscale]]
+  if cell_size > 1:
+    image = image.repeat(cell_size, axis = 0).repeat(cell_size, axis = 1)
+  return image
+
+# Auxiliar para que el pool de procesos reciba un solo argumento
+def _rasterize_job(job):
+  return rasterize_grid(*job).tobytes()
+
+# Escribe la simulación a un video o GIF (según la extensión) con ffmpeg,
+# enviándole los cuadros uno por uno. source es un GridCollector o un
+# TrajectoryLog. Los cuadros se rasterizan por lotes en un pool de procesos,
+# así que la memoria depende del tamaño del lote y no de la duración. Con
+# cell_size > 1 ffmpeg agranda cada celda sin suavizarla, así los procesos y
+# el pipe siguen moviendo un pixel por celda
+def render_simulation(source, path, fps = 10, stride = 1, downscale = 1,
+                      processes = None, batch_size = 64, cell_size = 1):
+  grids = source.grids() if isinstance(source, TrajectoryLog) else iter(source)
+  grids = itertools.islice(grids, 0, None, stride)
+  first = next(grids, None)
+  if first is None: return 0
+  height, width = first[::downscale, ::downscale].shape
+
+  # ffmpeg recibe RGB crudo por stdin; los tamaños pares los pide libx264
+  command = [matplotlib.rcParams["animation.ffmpeg_path"], "-y", "-loglevel",
+             "error", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s",
+             f"{width}x{height}", "-r", str(fps), "-i", "-"]
+  filters = []
+  if cell_size > 1:
+    filters.append(f"scale=iw*{cell_size}:ih*{cell_size}:flags=neighbor")
+  if not(path.endswith(".gif")):
+    filters.append("pad=ceil(iw/2)*2:ceil(ih/2)*2")
+    command += ["-pix_fmt", "yuv420p"]
+  if filters: command += ["-vf", ",".join(filters)]
+  encoder = subprocess.Popen(command + [path], stdin = subprocess.PIPE)
+
+  pool = multiprocessing.Pool(processes) if processes != 1 else None
+  frames = 0
+  try:
+    grids = itertools.chain([first], grids)
+    while True:
+      # Lote acotado de cuadros, rasterizado en paralelo y en orden
+      jobs = [(grid, downscale) for grid in itertools.islice(grids, batch_size)]
+      if not(jobs): break
+      images = (pool.map(_rasterize_job, jobs) if pool is not None
+                else map(_rasterize_job, jobs))
+      for image in images:
+        encoder.stdin.write(image)
+      frames += len(jobs)
+  finally:
+    if pool is not None: pool.close()
+    encoder.stdin.close()
+    encoder.wait()
+  return frames
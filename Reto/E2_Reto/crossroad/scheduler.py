@@ -0,0 +1,101 @@
+# Scheduler que solo activa a los agentes que pueden cambiar
+
+# Paquete esencial que ayuda a modelar sistemas multiagentes
+from mesa.time import SimultaneousActivation
+
+# Nativo de Python para recorrer a los agentes activos en orden
+import heapq
+
+#@title Scheduler de conjunto activo
+
+# Igual que SimultaneousActivation (mismo orden, step de todos y luego
+# advance), pero los agentes que se estacionan con park() no se activan hasta
+# que alguien los despierta con wake(). Un carro detenido se estaciona cuando
+# su step ya no puede cambiar nada hasta que cambie su semáforo o el carro de
+# enfrente, así el costo de un tick depende de los carros en movimiento
+class ActiveSetActivation(SimultaneousActivation):
+  # Constructor
+  def __init__(self, model):
+    super().__init__(model)
+
+    # Número de orden de cada agente según se agregó, y agente de cada número
+    self.order = {}
+    self.by_order = {}
+    self.next_order = 0
+
+    # Agentes activos y estacionados (con el tick en que se estacionaron),
+    # ambos por número de orden
+    self.active = set()
+    self.parked = {}
+
+    # Recorrido del tick en curso: números por activar y el último activado
+    self.ticking = False
+    self.pending = None
+    self.current = None
+
+  # Agrega a un agente activo al final del orden
+  def add(self, agent):
+    super().add(agent)
+    self.order[agent.unique_id] = self.next_order
+    self.by_order[self.next_order] = agent
+    self.active.add(self.next_order)
+    self.next_order += 1
+
+  # Quita a un agente del scheduler, esté activo o estacionado
+  def remove(self, agent):
+    super().remove(agent)
+    position = self.order.pop(agent.unique_id)
+    del self.by_order[position]
+    self.active.discard(position)
+    self.parked.pop(position, None)
+
+  # Activa en orden a los agentes activos, incluyendo a los que se despierten
+  # durante el recorrido, y luego hace advance de los que se activaron
+  def step(self):
+    self.ticking = True
+    self.pending = sorted(self.active)
+    stepped = []
+    while self.pending:
+      position = heapq.heappop(self.pending)
+      if position not in self.by_order: continue
+      self.current = position
+      agent = self.by_order[position]
+      agent.step()
+      stepped.append(agent)
+    self.pending = None
+    self.current = None
+    for agent in stepped: agent.advance()
+    self.ticking = False
+    self.steps += 1
+    self.time += 1
+
+  # Estaciona a un agente desde su propio step; su advance de este tick sí
+  # se hace
+  def park(self, agent):
+    position = self.order[agent.unique_id]
+    self.active.discard(position)
+    self.parked[position] = self.steps
+
+  # Despierta a un agente estacionado. Si le toca más adelante en el
+  # recorrido en curso se activa en este mismo tick y si no en el siguiente.
+  # Los ticks que se saltó se le reportan con resume(), contando el tick en
+  # curso si ya no alcanza a activarse en él
+  def wake(self, agent):
+    position = self.order.get(agent.unique_id)
+    if position not in self.parked: return
+    parked_at = self.parked.pop(position)
+    self.active.add(position)
+    if not(self.ticking):
+      agent.resume(self.steps - 1 - parked_at)
+    elif self.current is not None and position > self.current:
+      heapq.heappush(self.pending, position)
+      agent.resume(self.steps - 1 - parked_at)
+    else:
+      agent.resume(self.steps - parked_at)
+
+  # Cuenta a los agentes estacionados los ticks que llevan sin activarse, por
+  # ejemplo antes de tomar un snapshot entre ticks
+  def settle(self):
+    for position, parked_at in self.parked.items():
+      self.by_order[position].resume(self.steps - 1 - parked_at)
+      self.parked[position] = self.steps - 1
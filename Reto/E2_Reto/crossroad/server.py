@@ -0,0 +1,491 @@
+# Servidor HTTP que simula o repite el cruce para Unity
+
+# Paquetes para la transferencia de datos por HTTP
+# from pyngrok import ngrok
+from http.server import BaseHTTPRequestHandler
+import threading
+import queue
+from urllib.parse import urlparse, parse_qs
+import logging
+import json
+import time
+
+from .frames import FrameEncoder
+from .metrics import Metrics, model_gauges
+from .model import CrossroadModel
+from .sessions import (SessionPool, STOP_RESPONSE, INVALID_RESPONSE,
+                       MAX_STEPS, parse_steps)
+from .trajectory import TrajectoryLog
+
+# Respuesta cuando el productor de cuadros falló, se envía con estado 500 y
+# no detiene al servidor: board-init, /metrics y un nuevo lights-init, que
+# arranca otro productor, siguen respondiendo
+ERROR_RESPONSE = json.dumps({"order": "error"})
+
+#@title Productor de cuadros en segundo plano
+
+# Avanza el modelo un tick y prepara todas las formas en que se puede enviar.
+# Con métricas lleva también el estado del modelo en ese tick para /metrics
+def build_frame(model):
+  model.step()
+  cars, lights = model.report_actions()
+  return {"cars": cars, "lights": lights, "columns": model.report_columns(),
+          "json": json.dumps({"carsJson": json.dumps(cars),
+                              "lightsJson": json.dumps(lights)}),
+          "gauges": model_gauges(model) if model.metrics is not None else None}
+
+# Hilo que simula por delante del cliente y deja los cuadros ya serializados
+# en un buffer acotado. Si el buffer se llena, espera a que el cliente consuma.
+# Solo este hilo toca al modelo mientras corre, así que /metrics lee el
+# estado del último cuadro entregado en gauges en vez del modelo. Si el hilo
+# falla deja None en el buffer, y next_frame devuelve None en vez de esperar
+# para siempre con el candado tomado; también si un cuadro tarda más de
+# frame_timeout segundos
+class FrameProducer:
+  # Constructor, antes de que el hilo empiece a avanzar el modelo
+  def __init__(self, model, buffer_size, frame_timeout = 30.0):
+    self.model = model
+    self.frames = queue.Queue(maxsize = buffer_size)
+    self.frame_timeout = frame_timeout
+    self.running = False
+    self.failed = False
+    self.produced = 0
+    self.gauges = model_gauges(model) if model.metrics is not None else None
+    self.thread = threading.Thread(target = self.produce, daemon = True)
+
+  # Inicia la simulación en segundo plano
+  def start(self):
+    self.running = True
+    self.thread.start()
+
+  # Ciclo del hilo, el put con espera es la contrapresión sobre el modelo.
+  # Un error del modelo o de las grabaciones termina el hilo dejando None
+  def produce(self):
+    try:
+      while self.running:
+        frame = build_frame(self.model)
+        if not(self.put(frame)): return
+        self.produced += 1
+    except Exception:
+      logging.exception("El productor de cuadros falló")
+      self.failed = True
+      self.put(None)
+
+  # Deja un elemento en el buffer esperando lugar mientras el hilo siga
+  # activo. False si se detuvo antes
+  def put(self, frame):
+    while self.running:
+      try:
+        self.frames.put(frame, timeout = 0.1)
+        return True
+      except queue.Full:
+        continue
+    return False
+
+  # Siguiente cuadro del buffer, espera si el productor aún no lo tiene. None
+  # si el productor falló o no entregó un cuadro a tiempo
+  def next_frame(self):
+    if self.failed and self.frames.empty(): return None
+    try:
+      frame = self.frames.get(timeout = self.frame_timeout)
+    except queue.Empty:
+      return None
+    if frame is None:
+      # El aviso se queda para los siguientes requests
+      self.frames.put(None)
+      return None
+    if frame["gauges"] is not None: self.gauges = frame["gauges"]
+    return frame
+
+  # Detiene el hilo productor
+  def stop(self):
+    self.running = False
+    self.thread.join()
+
+#@title Clase Servidor de la simulación
+
+# Clase que maneja las requests al servidor: envía y recibe datos
+# Controla la simulación según lo vaya pidiendo Unity
+class SimulationServer(BaseHTTPRequestHandler):
+  # Modelo de MESA que se simulará, activación del logging
+  model = None
+  log_active = False
+  start_time = None
+  initialized = False
+
+  # Codificador del formato binario por deltas, se crea con "lights-init"
+  encoder = None
+
+  # Con un buffer mayor a cero, un productor simula por delante del cliente
+  # desde "lights-init" y los steps solo toman cuadros ya listos
+  buffer_size = 0
+  producer = None
+
+  # Métricas compartidas con el modelo, None las desactiva sin costo
+  metrics = None
+
+  # Máximo de ticks por "step-n"
+  max_steps = MAX_STEPS
+
+  # Sesiones independientes para los POST con campo "session", o para todos
+  # si no hay modelo. None atiende solo al modelo de la clase
+  sessions = None
+
+  # HTTP/1.1 mantiene viva la conexión entre requests del mismo cliente. Sin
+  # Nagle, los encabezados y el cuerpo no esperan al ACK retrasado del cliente
+  protocol_version = "HTTP/1.1"
+  disable_nagle_algorithm = True
+
+  # Candado para que los hilos del servidor no avancen el modelo a la vez
+  lock = threading.Lock()
+
+  # Manejo de un método GET enviado al servidor
+  def do_GET(self):
+    self.log("GET")
+    url = urlparse(self.path)
+    if url.path == "/stream":
+      self.stream(float(parse_qs(url.query).get("rate", ["10"])[0]))
+      return
+    if url.path == "/metrics" and self.metrics is not None:
+      # Con productor el modelo avanza fuera del candado y se usa el estado
+      # que viajó con el último cuadro entregado
+      with self.lock:
+        if self.producer is not None:
+          gauges = self.producer.gauges
+        else:
+          gauges = model_gauges(self.model) if self.model is not None else None
+      response = self.metrics.render(gauges)
+      if self.sessions is not None:
+        response += "\n".join(self.sessions.render_metrics()) + "\n"
+      response = response.encode('utf-8')
+      self._set_response(len(response), "text/plain; version=0.0.4")
+      self.wfile.write(response)
+      return
+    response = f"GET request for {self.path}".encode('utf-8')
+    self._set_response(len(response), "text/plain")
+    self.wfile.write(response)
+
+
+  # Manejo de un método POST enviado al servidor
+  def do_POST(self):
+    # Lectura del método POST que ha llegado con un request
+    content_length = int(self.headers['Content-Length'])
+    post_data = json.loads(self.rfile.read(content_length))
+    self.log("POST", post_data)
+    
+    # Selección de la respuesta según la petición. Envío codificado
+    session_id = self.session_id(post_data)
+    if self.metrics is None:
+      response = self.respond(session_id, post_data)
+    else:
+      start = time.perf_counter()
+      response = self.respond(session_id, post_data)
+      request = post_data["request"]
+      self.metrics.observe("request",
+        request if request in self.metrics.REQUESTS else "other",
+        time.perf_counter() - start)
+    if isinstance(response, bytes):
+      encoded = response
+      self._set_response(len(encoded), 'application/octet-stream')
+    else:
+      encoded = response.encode('utf-8')
+      self._set_response(len(encoded), status = self.STATUS.get(response, 200))
+    self.wfile.write(encoded)
+    if response == STOP_RESPONSE and session_id is None:
+      # Se cierra la conexión y se detiene el servidor desde otro hilo, pues
+      # serve_forever espera a que terminen las requests en curso
+      self.close_connection = True
+      threading.Thread(target = self.server.shutdown, daemon = True).start()
+
+
+  # Sesión a la que va el POST, o None si lo atiende el modelo de la clase
+  def session_id(self, post_data):
+    if self.sessions is None: return None
+    if "session" in post_data: return str(post_data["session"])
+    return "default" if self.model is None else None
+
+  # Respuesta del modelo de la clase, que solo avanza un hilo a la vez, o de
+  # la sesión, que solo espera a las otras sesiones de su mismo proceso
+  def respond(self, session_id, post_data):
+    if session_id is not None:
+      return self.sessions.handle(session_id, post_data)
+    with self.lock:
+      return self.choose_response(post_data["request"], post_data)
+
+  # Envía los cuadros por server-sent events a una tasa de ticks por segundo,
+  # hasta alcanzar el tiempo máximo o que el cliente cierre la conexión
+  def stream(self, rate):
+    self.send_response(200)
+    self.send_header('Content-type', 'text/event-stream')
+    self.send_header('Cache-Control', 'no-cache')
+    self.end_headers()
+    self.close_connection = True
+    period = 1 / rate if rate > 0 else 0
+    next_time = time.time()
+    try:
+      while self.initialized and not(self.finished()):
+        with self.lock:
+          frame = self.stream_frame()
+        if frame is None: break
+        cars, lights = frame
+        data = json.dumps({"cars": cars, "lights": lights})
+        self.wfile.write(f"data: {data}\n\n".encode('utf-8'))
+        self.wfile.flush()
+        next_time += period
+        time.sleep(max(0, next_time - time.time()))
+      self.wfile.write(b"event: stop\ndata: {}\n\n")
+    except (BrokenPipeError, ConnectionResetError):
+      pass
+
+  # Siguiente cuadro para el stream, del productor o avanzando el modelo.
+  # None si el productor ya no tiene cuadros
+  def stream_frame(self):
+    if self.producer is not None:
+      frame = self.producer.next_frame()
+      return (frame["cars"], frame["lights"]) if frame is not None else None
+    self.model.step()
+    return self.model.report_actions()
+
+  # True una vez alcanzado el tiempo máximo de la simulación
+  def finished(self):
+    return time.time() - self.start_time > self.model.max_duration
+
+  # Además del request, data trae los campos opcionales del POST: "steps"
+  # para "step-n", acotado a max_steps, y "keyframe" para "step-binary"
+  def choose_response(self, request, data = None):
+    # Variables de trabajo. Se devuelve la transposición de get_grid
+    response = {"data": ""}
+    data = data or {}
+
+    # Árbol de respuestas de Python para Unity según el request
+    # Da prioridad a enviar un stop si se alcanza el tiempo máximo
+    if self.finished():
+      response = {"order" : "stop"}
+    elif request == "board-init":
+      response = {"m": self.model.m, "n": self.model.n}
+    elif request == "lights-init":
+      response = {"Items" : [{"id": s.id, "state": s.state,
+        "x": self.model.stoplight_pos[s.id][0],
+        "y": self.model.stoplight_pos[s.id][1]}
+        for s in self.model.stoplights]}
+      SimulationServer.initialized = True
+      SimulationServer.encoder = FrameEncoder()
+      if self.buffer_size > 0 and (self.producer is None or self.producer.failed):
+        SimulationServer.producer = FrameProducer(self.model, self.buffer_size)
+        self.producer.start()
+    elif request == "step" and self.producer is not None:
+      # El cuadro ya fue simulado y serializado en segundo plano. Sin cuadro
+      # el productor falló o tardó demasiado
+      frame = self.producer.next_frame()
+      return frame["json"] if frame is not None else ERROR_RESPONSE
+    elif request == "step" and SimulationServer.initialized:
+      self.model.step()
+      cars, lights = self.model.report_actions()
+      response = {"carsJson": json.dumps(cars),
+                  "lightsJson": json.dumps(lights)}
+    elif request == "step-n" and SimulationServer.initialized:
+      # Varios ticks en una sola respuesta, sin JSON dentro de JSON
+      steps = parse_steps(data, self.max_steps)
+      if steps is None: return INVALID_RESPONSE
+      frames = []
+      for _ in range(steps):
+        if self.producer is not None:
+          frame = self.producer.next_frame()
+          if frame is None: return ERROR_RESPONSE
+          cars, lights = frame["cars"], frame["lights"]
+        else:
+          self.model.step()
+          cars, lights = self.model.report_actions()
+        frames.append({"cars": cars, "lights": lights})
+      response = {"frames": frames}
+    elif request == "step-binary" and SimulationServer.initialized:
+      # Formato binario con solo los cambios, el cliente puede pedir un
+      # cuadro completo para resincronizarse
+      if data.get("keyframe"): self.encoder.reset()
+      if self.producer is not None:
+        frame = self.producer.next_frame()
+        if frame is None: return ERROR_RESPONSE
+        return self.encoder.encode(*frame["columns"])
+      self.model.step()
+      return self.encoder.encode(*self.model.report_columns())
+    else:
+      response = {"order" : "wait"}
+    return json.dumps(response)
+        
+  # Estado HTTP de las respuestas que no son de éxito
+  STATUS = {ERROR_RESPONSE: 500, INVALID_RESPONSE: 400}
+
+  # Configura una respuesta HTTP con encabezado, de éxito salvo que se indique
+  # otro estado. La longitud es necesaria para que el cliente reutilice la
+  # conexión
+  def _set_response(self, length, content_type = 'application/json', status = 200):
+    self.send_response(status)
+    self.send_header('Content-type', content_type)
+    self.send_header('Content-Length', str(length))
+    self.end_headers()
+
+  # Logging de la clase padre sobrescrito para poder desactivar logs
+  def log_message(self, format, *args):
+    if (self.log_active):
+      super().log_message(format, *args)
+
+  # Log de métodos HTTP por logging
+  def log(self, method, data = None):
+    # Requiere activación
+    if not(self.log_active): return
+    if method == "GET":
+      logging.info("GET request,\nPath: %s\nHeaders:\n%s\n",
+      str(self.path), str(self.headers))
+    elif method == "POST":
+      logging.info("POST request,\nPath: %s\nHeaders:\n%s\n\nBody:\n%s\n",
+      str(self.path),str(self.headers), json.dumps(data))
+
+#@title Servidor de repetición
+
+# Sirve a Unity un log grabado con el mismo protocolo de SimulationServer,
+# sin simular. La velocidad es cuántos steps avanza cada request (menor a uno
+# repite cuadros) y "seek" salta a cualquier step
+class ReplayServer(SimulationServer):
+  # Log que se repite, posición actual y velocidad de reproducción
+  trajectory = None
+  position = 0.0
+  speed = 1.0
+
+  # La repetición termina al llegar al final del log
+  def finished(self):
+    return int(ReplayServer.position) >= len(self.trajectory)
+
+  # Toma el cuadro actual y avanza la posición según la velocidad
+  def replay_frame(self):
+    i = int(ReplayServer.position)
+    ReplayServer.position += self.speed
+    return i
+
+  # Siguiente cuadro para el stream desde el log
+  def stream_frame(self):
+    return self.trajectory.frame(self.replay_frame())
+
+  # Acepta los mismos requests más {"request": "seek", "step": k}
+  def choose_response(self, request, data = None):
+    data = data or {}
+    meta = self.trajectory.meta
+    if request == "seek":
+      # Salto directo a un step, el índice del log lo hace en O(1)
+      step = min(max(0, int(data.get("step", 0))), len(self.trajectory))
+      ReplayServer.position = float(step)
+      response = {"order": "wait"}
+    elif self.finished():
+      response = {"order" : "stop"}
+    elif request == "board-init":
+      response = {"m": meta["m"], "n": meta["n"]}
+    elif request == "lights-init":
+      states = (self.trajectory.frame(0)[1]["Items"] if len(self.trajectory) else
+                [{"state": "red"} for _ in meta["lights"]])
+      response = {"Items": [dict(light, state = state["state"])
+                            for light, state in zip(meta["lights"], states)]}
+      SimulationServer.initialized = True
+      SimulationServer.encoder = FrameEncoder()
+    elif request == "step" and self.initialized:
+      cars, lights = self.trajectory.frame(self.replay_frame())
+      response = {"carsJson": json.dumps(cars),
+                  "lightsJson": json.dumps(lights)}
+    elif request == "step-n" and self.initialized:
+      steps = parse_steps(data, self.max_steps)
+      if steps is None: return INVALID_RESPONSE
+      frames = []
+      for _ in range(steps):
+        if self.finished(): break
+        cars, lights = self.trajectory.frame(self.replay_frame())
+        frames.append({"cars": cars, "lights": lights})
+      response = {"frames": frames}
+    elif request == "step-binary" and self.initialized:
+      if data.get("keyframe"): self.encoder.reset()
+      return self.encoder.encode(*self.trajectory.columns(self.replay_frame()))
+    else:
+      response = {"order" : "wait"}
+    return json.dumps(response)
+
+# Ata un log grabado al servidor de repetición
+def attach_log(replay_server, path, speed = 1.0):
+  replay_server.trajectory = TrajectoryLog(path)
+  replay_server.position = 0.0
+  replay_server.speed = speed
+
+#@title Asignación del modelo
+
+# Dado que el servidor recibe una clase y no un objeto, se tiene
+# que atar al modelo multi-agentes como una variable estática
+# Con buffer_size mayor a cero la simulación corre por delante del cliente.
+# Con metrics se miden las fases y requests y se exponen en GET /metrics.
+# Las opciones restantes se pasan al constructor del modelo
+def attach_model(simulation_server, model_params, buffer_size = 0,
+                 metrics = False, max_steps = MAX_STEPS, **options):
+  new_model = CrossroadModel(*model_params, **options)
+  simulation_server.model = new_model
+  simulation_server.buffer_size = buffer_size
+  simulation_server.max_steps = max_steps
+  simulation_server.metrics = Metrics() if metrics else None
+  new_model.metrics = simulation_server.metrics
+
+# Atiende a varios clientes a la vez, cada uno con su propia simulación, en
+# PROCESSES procesos. Los POST con "session" van a la sesión de ese id; si el
+# servidor no tiene modelo propio, los que no lo traen van a la sesión
+# "default". Las opciones restantes se pasan al constructor de cada modelo
+def attach_sessions(simulation_server, model_params, processes = 2,
+                    max_sessions = 64, idle_timeout = 300,
+                    max_steps = MAX_STEPS, **options):
+  simulation_server.sessions = SessionPool(model_params, processes,
+                                           max_sessions, idle_timeout,
+                                           max_steps, **options)
+
+#@title Run del servidor
+
+# Run para el servidor, habiendo creado el servidor que conoce al modelo
+def run(server_class, handler_class, port, log):
+    # Asegura solo tener un servidor a la vez, matando a los demás
+    # ngrok.kill()
+    
+    # Crea el servidor y lo conecta al túnel en el puerto abierto
+    httpd = server_class(('', port), handler_class)
+    # public_url = ngrok.connect(port, proto="http", options={"bind_tls": True}).public_url
+    # ngrok.connect(port)
+
+    # Impresión para monitorización y guía al usuario final
+    if log:
+      logging.basicConfig(level = logging.INFO)
+      logging.info("Iniciando httpd...\n")
+    print("\nServidor corriendo. Ctrl+C para detener conexión y continuar")
+    # print(f"Túnel público: {public_url}")
+    print(f"Túnel local: http://127.0.0.1:{port}")
+
+    # Corre el servidor hasta cualquier excepción, de teclado o de fin
+    handler_class.start_time = time.time()
+    try: httpd.serve_forever()
+    except: pass
+    handler_class.end_time = time.time()
+
+    # Detiene al productor de cuadros y a los procesos de sesiones si se usaron
+    if getattr(handler_class, "producer", None) is not None:
+      handler_class.producer.stop()
+    if getattr(handler_class, "sessions", None) is not None:
+      handler_class.sessions.close()
+
+    # Cierre del servidor
+    httpd.server_close()
+    if log: logging.info("Deteniendo httpd...\n")
+    print("Servidor detenido. Continúa la animación en Colab")
+
+#@title Estadísticas de ejecución
+
+# Impresión de los datos relevantes para MAS
+def show_statistics(simulation_server):
+  # Extracción de los tiempos de ejecución
+  print("\nEstadísticas de la ejecución")
+  max_duration = simulation_server.model.max_duration
+  duration = simulation_server.end_time - simulation_server.start_time
+
+  # Formateo y restricción a un valor máximo del tiempo de ejecución
+  if (duration >= max_duration):
+    print(f"Tiempo de ejecución: {max_duration}s (Duración máxima permitida)")
+  else:
+    print(f"Tiempo de ejecución: {round(duration, 3)}s (Tarea terminada antes de tiempo)")
@@ -0,0 +1,377 @@
+# Sesiones independientes de simulación repartidas en procesos
+
+# Nativos de Python para repartir las sesiones y atenderlas a la vez
+import multiprocessing
+import threading
+import json
+import time
+
+from .frames import FrameEncoder
+from .model import CrossroadModel
+
+#@title Sesiones de simulación
+
+# Respuesta con la que el servidor pide al cliente que termine
+STOP_RESPONSE = json.dumps({"order": "stop"})
+
+# Respuesta cuando ya no caben más sesiones en el servidor
+FULL_RESPONSE = json.dumps({"order": "full"})
+
+# Respuesta a un request con campos inválidos, la sesión sigue abierta
+INVALID_RESPONSE = json.dumps({"order": "invalid"})
+
+# Máximo de ticks que se simulan en un solo "step-n", para que un request no
+# retenga al modelo por tiempo indefinido
+MAX_STEPS = 1000
+
+# Ticks pedidos en el campo "steps" de "step-n", acotados entre 1 y
+# max_steps. None si no es un entero
+def parse_steps(data, max_steps = MAX_STEPS):
+  steps = data.get("steps", 1)
+  if isinstance(steps, bool) or not(isinstance(steps, (int, str))): return None
+  try:
+    steps = int(steps)
+  except ValueError:
+    return None
+  return min(max(1, steps), max_steps)
+
+# Parámetros del modelo que un cliente puede cambiar al abrir su sesión con
+# el campo "params", en el orden del constructor, y opciones que también
+SESSION_PARAMS = ["M", "N", "SPAWN_RATE", "LIGHT_TICK", "SMART", "MAX_DURATION"]
+SESSION_OPTIONS = ["ENGINE", "seed"]
+
+# Tipos y rangos aceptados para cada parámetro del cliente. Con menos de 7
+# celdas por lado los carros se salen de la cuadrícula, con LIGHT_TICK menor
+# a 3 un semáforo se queda en verde, y el máximo por lado acota la memoria
+SESSION_LIMITS = {"M": (int, 7, 512), "N": (int, 7, 512),
+                  "SPAWN_RATE": (float, 0, 1), "LIGHT_TICK": (int, 3, 10000),
+                  "SMART": (bool, False, True),
+                  "MAX_DURATION": (float, 0, 86400)}
+SESSION_CHOICES = {"ENGINE": ["agents", "arrays"]}
+
+# Revisa los cambios pedidos por un cliente antes de construir su modelo.
+# Lanza ValueError con el primer parámetro inválido
+def check_params(params):
+  if not(isinstance(params, dict)): raise ValueError("params")
+  for key, value in params.items():
+    if key in SESSION_LIMITS:
+      kind, low, high = SESSION_LIMITS[key]
+      if kind is bool:
+        valid = isinstance(value, bool)
+      else:
+        # bool es un int para Python, pero no es un tamaño ni una tasa
+        valid = (isinstance(value, (int, float) if kind is float else int) and
+                 not(isinstance(value, bool)))
+      if not(valid) or not(low <= value <= high): raise ValueError(key)
+    elif key in SESSION_CHOICES:
+      if value not in SESSION_CHOICES[key]: raise ValueError(key)
+    elif key == "seed":
+      if value is not None and (not(isinstance(value, int)) or
+                                isinstance(value, bool)):
+        raise ValueError(key)
+
+# Un cliente con su propio modelo, codificador y reloj. Responde el mismo
+# protocolo que SimulationServer pero sin estado compartido con otros
+class Session:
+  # Constructor, params son los cambios pedidos por el cliente
+  def __init__(self, model_params, options, params = None,
+               max_steps = MAX_STEPS):
+    model_params = list(model_params)
+    options = dict(options)
+    params = params or {}
+    check_params(params)
+    for key, value in params.items():
+      if key in SESSION_PARAMS:
+        model_params[SESSION_PARAMS.index(key)] = value
+      elif key in SESSION_OPTIONS:
+        options[key] = value
+    options.setdefault("COLLECT_FRAMES", False)
+    self.model = CrossroadModel(*model_params, **options)
+    self.encoder = FrameEncoder()
+    self.initialized = False
+    self.start_time = time.time()
+    self.max_steps = max_steps
+
+  # True una vez alcanzado el tiempo máximo de la sesión
+  def finished(self):
+    return time.time() - self.start_time > self.model.max_duration
+
+  # Árbol de respuestas de SimulationServer aplicado a esta sesión
+  def respond(self, request, data):
+    response = {"order" : "wait"}
+    if self.finished():
+      response = {"order" : "stop"}
+    elif request == "board-init":
+      response = {"m": self.model.m, "n": self.model.n}
+    elif request == "lights-init":
+      response = {"Items" : [{"id": s.id, "state": s.state,
+        "x": self.model.stoplight_pos[s.id][0],
+        "y": self.model.stoplight_pos[s.id][1]}
+        for s in self.model.stoplights]}
+      self.initialized = True
+      self.encoder = FrameEncoder()
+    elif request == "step" and self.initialized:
+      self.model.step()
+      cars, lights = self.model.report_actions()
+      response = {"carsJson": json.dumps(cars),
+                  "lightsJson": json.dumps(lights)}
+    elif request == "step-n" and self.initialized:
+      steps = parse_steps(data, self.max_steps)
+      if steps is None: return INVALID_RESPONSE
+      frames = []
+      for _ in range(steps):
+        self.model.step()
+        cars, lights = self.model.report_actions()
+        frames.append({"cars": cars, "lights": lights})
+      response = {"frames": frames}
+    elif request == "step-binary" and self.initialized:
+      if data.get("keyframe"): self.encoder.reset()
+      self.model.step()
+      return self.encoder.encode(*self.model.report_columns())
+    return json.dumps(response)
+
+# Sesiones que viven en un mismo proceso
+class SessionHost:
+  # Constructor
+  def __init__(self, model_params, options, max_steps = MAX_STEPS):
+    self.model_params = model_params
+    self.options = options
+    self.max_steps = max_steps
+    self.sessions = {}
+
+  # Atiende un request de la sesión dada, creándola con el primero. Las
+  # sesiones que terminan se descartan, y una sesión con parámetros que el
+  # modelo no acepta termina antes de empezar. Un request que hace fallar a
+  # la sesión solo la descarta a ella, sin tumbar al proceso ni a las demás
+  def request(self, session_id, data):
+    if session_id not in self.sessions:
+      try:
+        self.sessions[session_id] = Session(self.model_params, self.options,
+                                            data.get("params"), self.max_steps)
+      except (TypeError, ValueError, IndexError):
+        return STOP_RESPONSE
+    try:
+      response = self.sessions[session_id].respond(data["request"], data)
+    except Exception:
+      response = STOP_RESPONSE
+    if response == STOP_RESPONSE: del self.sessions[session_id]
+    return response
+
+  # Descarta una sesión, si existe
+  def close(self, session_id):
+    self.sessions.pop(session_id, None)
+
+# Ciclo de comandos de un proceso que atiende sesiones
+def _session_worker(conn, host):
+  while True:
+    try:
+      command, payload = conn.recv()
+    except EOFError:
+      # El servidor cerró su extremo, no hay más comandos
+      break
+    if command == "request":
+      conn.send(host.request(*payload))
+    elif command == "close":
+      conn.send(host.close(payload))
+    else:
+      break
+  conn.close()
+
+# Proceso con sesiones, o el proceso actual si no se usan procesos. Su
+# candado hace que solo un hilo a la vez hable con él
+class SessionWorker:
+  # Constructor
+  def __init__(self, host, process = True):
+    self.lock = threading.Lock()
+    self.host = host
+    self.process = None
+    if process: self.spawn()
+
+  # Arranca el proceso con un anfitrión sin sesiones
+  def spawn(self):
+    self.conn, child_conn = multiprocessing.Pipe()
+    self.process = multiprocessing.Process(target = _session_worker,
+      args = (child_conn, self.host), daemon = True)
+    self.process.start()
+
+  # False si el proceso murió
+  def alive(self):
+    return self.process is None or self.process.is_alive()
+
+  # Reemplaza un proceso muerto por uno nuevo; sus sesiones se perdieron
+  def respawn(self):
+    with self.lock:
+      self.conn.close()
+      self.process.join()
+      self.spawn()
+
+  # Ejecuta un comando del anfitrión y espera su resultado. Si el proceso ya
+  # no responde, sus sesiones reciben la orden de terminar
+  def call(self, command, payload):
+    with self.lock:
+      if self.process is None:
+        if command == "request": return self.host.request(*payload)
+        return self.host.close(payload)
+      try:
+        self.conn.send((command, payload))
+        return self.conn.recv()
+      except (BrokenPipeError, EOFError, OSError):
+        return STOP_RESPONSE if command == "request" else None
+
+  # Termina el proceso, si lo hay, aunque ya haya muerto o no conteste
+  def close(self):
+    if self.process is not None:
+      with self.lock:
+        try:
+          self.conn.send(("close-worker", None))
+        except (BrokenPipeError, EOFError, OSError):
+          pass
+        self.conn.close()
+      self.process.join(5)
+      if self.process.is_alive():
+        self.process.terminate()
+        self.process.join()
+
+# Sesiones de varios clientes identificadas por el campo "session" del POST.
+# Cada sesión se asigna al proceso con menos sesiones y ahí se queda, así que
+# las sesiones de procesos distintos avanzan en paralelo. Las sesiones sin
+# requests por IDLE_TIMEOUT segundos se descartan, con cada request y desde
+# un hilo que las barre aunque no lleguen requests, y con MAX_SESSIONS
+# abiertas una nueva recibe {"order": "full"}. Un proceso que muere se
+# reemplaza antes de asignar la siguiente sesión nueva, y las sesiones que
+# tenía reciben {"order": "stop"}. Con PROCESSES = 0 las sesiones viven en
+# el proceso del servidor
+class SessionPool:
+  # Constructor, las opciones restantes se pasan al constructor del modelo
+  def __init__(self, model_params, PROCESSES = 2, MAX_SESSIONS = 64,
+               IDLE_TIMEOUT = 300, MAX_STEPS = MAX_STEPS, **options):
+    self.max_sessions = MAX_SESSIONS
+    self.idle_timeout = IDLE_TIMEOUT
+    self.workers = [SessionWorker(SessionHost(model_params, options, MAX_STEPS))
+                    for _ in range(PROCESSES)]
+    if not(self.workers):
+      self.workers = [SessionWorker(SessionHost(model_params, options, MAX_STEPS),
+                                    False)]
+
+    # Proceso y último uso de cada sesión, y sesiones por proceso. El
+    # candado solo protege esta tabla, no la simulación
+    self.lock = threading.Lock()
+    self.sessions = {}
+    self.loads = [0] * len(self.workers)
+    self.lost = {}
+    self.respawned = 0
+    self.evicted = 0
+    self.rejected = 0
+
+    # Hilo que barre las sesiones inactivas cada mitad de IDLE_TIMEOUT, hasta
+    # 30 segundos. Se inicia después de los procesos para no copiarlo a ellos
+    self.closing = threading.Event()
+    self.sweeper = threading.Thread(target = self.sweep_idle, daemon = True,
+      args = (max(0.1, min(IDLE_TIMEOUT / 2, 30)),))
+    self.sweeper.start()
+
+  # Atiende un request de la sesión dada, abriéndola si es nueva. Con
+  # "session-close" el cliente la cierra sin esperar a que quede inactiva
+  def handle(self, session_id, data):
+    if data["request"] == "session-close":
+      self.close_session(session_id)
+      return STOP_RESPONSE
+    now = time.time()
+    with self.lock:
+      idle = self.take_idle(now)
+      self.respawn_dead(now)
+      lost = self.lost.pop(session_id, None) is not None
+      if lost:
+        worker = None
+      elif session_id not in self.sessions:
+        if len(self.sessions) >= self.max_sessions:
+          self.rejected += 1
+          worker = None
+        else:
+          worker = self.loads.index(min(self.loads))
+          self.loads[worker] += 1
+          self.sessions[session_id] = [worker, now]
+      else:
+        worker = self.sessions[session_id][0]
+        self.sessions[session_id][1] = now
+    self.close_idle(idle)
+    if lost: return STOP_RESPONSE
+    if worker is None: return FULL_RESPONSE
+
+    response = self.workers[worker].call("request", (session_id, data))
+    if response == STOP_RESPONSE: self.forget(session_id)
+    return response
+
+  # Saca de la tabla a las sesiones inactivas y devuelve (sesión, proceso)
+  # para cerrarlas fuera del candado
+  def take_idle(self, now):
+    idle = [(session_id, worker) for session_id, (worker, last_used)
+            in self.sessions.items() if now - last_used > self.idle_timeout]
+    for session_id, worker in idle:
+      del self.sessions[session_id]
+      self.loads[worker] -= 1
+    self.evicted += len(idle)
+    self.lost = {session_id: lost_at for session_id, lost_at
+                 in self.lost.items() if now - lost_at <= self.idle_timeout}
+    return idle
+
+  # Reemplaza los procesos muertos para que no reciban sesiones nuevas, que
+  # irían a ellos por tener la menor carga. Sus sesiones quedan en lost para
+  # que su siguiente request reciba la orden de terminar
+  def respawn_dead(self, now):
+    for worker, session_worker in enumerate(self.workers):
+      if session_worker.alive(): continue
+      for session_id in [session_id for session_id, (owner, _)
+                         in self.sessions.items() if owner == worker]:
+        del self.sessions[session_id]
+        self.lost[session_id] = now
+      self.loads[worker] = 0
+      self.respawned += 1
+      session_worker.respawn()
+
+  # Cierra en sus procesos las sesiones sacadas con take_idle
+  def close_idle(self, idle):
+    for idle_id, idle_worker in idle:
+      self.workers[idle_worker].call("close", idle_id)
+
+  # Ciclo del hilo que barre las sesiones inactivas sin esperar a un request
+  def sweep_idle(self, period):
+    while not(self.closing.wait(period)):
+      with self.lock:
+        idle = self.take_idle(time.time())
+      self.close_idle(idle)
+
+  # Quita una sesión de la tabla
+  def forget(self, session_id):
+    with self.lock:
+      entry = self.sessions.pop(session_id, None)
+      if entry is not None: self.loads[entry[0]] -= 1
+    return entry
+
+  # Cierra una sesión a petición del cliente
+  def close_session(self, session_id):
+    entry = self.forget(session_id)
+    if entry is not None: self.workers[entry[0]].call("close", session_id)
+
+  # Líneas de /metrics con las sesiones abiertas, descartadas y rechazadas, y
+  # los procesos reemplazados
+  def render_metrics(self):
+    with self.lock:
+      return [
+        "# TYPE crossroad_sessions gauge",
+        f"crossroad_sessions {len(self.sessions)}",
+        "# TYPE crossroad_sessions_evicted_total counter",
+        f"crossroad_sessions_evicted_total {self.evicted}",
+        "# TYPE crossroad_sessions_rejected_total counter",
+        f"crossroad_sessions_rejected_total {self.rejected}",
+        "# TYPE crossroad_session_workers_respawned_total counter",
+        f"crossroad_session_workers_respawned_total {self.respawned}"]
+
+  # Detiene el barrido y termina los procesos de las sesiones
+  def close(self):
+    self.closing.set()
+    self.sweeper.join()
+    for worker in self.workers: worker.close()
+    self.sessions = {}
+    self.lost = {}
+    self.loads = [0] * len(self.workers)
@@ -0,0 +1,107 @@
+# Grabación de trayectorias a disco y su lectura para repetirlas
+
+# Paquete matemático utilizado para matrices de declaración sencilla
+import numpy as np
+
+# Nativos de Python para los metadatos y archivos del log
+import json
+
+from .collector import LIGHT_CODES
+from .engine import ACTIONS, DIRECTIONS, LIGHT_STATES, TURNS
+from .frames import FRAME_COLUMNS
+
+#@title Grabación y repetición de trayectorias
+
+# Registro de un carro en el log, mismas columnas del formato binario
+TRAJECTORY_DTYPE = np.dtype(FRAME_COLUMNS)
+
+# Escribe un log de trayectorias: los carros de todos los steps seguidos en
+# un archivo, el índice del primer carro de cada step en otro, los estados de
+# los semáforos en un tercero y los datos del cruce en un JSON
+class TrajectoryRecorder:
+  # Constructor, escribe los metadatos y abre los archivos para agregar
+  def __init__(self, path, model):
+    self.path = path
+    meta = {"m": model.m, "n": model.n, "max_duration": model.max_duration,
+            "lights": [{"id": s.id, "x": s.pos[0], "y": s.pos[1]}
+                       for s in model.stoplights]}
+    with open(path + ".json", "w") as meta_file: json.dump(meta, meta_file)
+    np.save(path + ".terrain.npy", model.terrain_layer)
+    self.cars_file = open(path + ".cars", "wb")
+    self.lights_file = open(path + ".lights", "wb")
+    self.index_file = open(path + ".index", "wb")
+    self.records = 0
+    self.index_file.write(np.int64(0).tobytes())
+
+  # Agrega el estado del modelo después de un step
+  def append(self, model):
+    cars, lights = model.report_columns()
+    records = np.empty(cars["id"].size, dtype = TRAJECTORY_DTYPE)
+    for name, _ in FRAME_COLUMNS: records[name] = cars[name]
+    self.cars_file.write(records.tobytes())
+    self.lights_file.write(lights.astype(np.uint8).tobytes())
+    self.records += records.size
+    self.index_file.write(np.int64(self.records).tobytes())
+
+  # Escribe a disco lo pendiente, el log queda legible hasta este step
+  def flush(self):
+    for file in (self.cars_file, self.lights_file, self.index_file):
+      file.flush()
+
+  # Cierra los archivos del log
+  def close(self):
+    for file in (self.cars_file, self.lights_file, self.index_file):
+      file.close()
+
+# Lectura de un log de trayectorias con np.memmap. Cualquier step se lee en
+# O(1) con el índice, sin cargar el log completo a memoria
+class TrajectoryLog:
+  # Constructor
+  def __init__(self, path):
+    with open(path + ".json") as meta_file: self.meta = json.load(meta_file)
+    self.index = np.memmap(path + ".index", dtype = np.int64, mode = "r")
+    self.steps = self.index.size - 1
+    n_lights = len(self.meta["lights"])
+    self.lights = (np.memmap(path + ".lights", dtype = np.uint8, mode = "r")
+                   [:self.steps * n_lights].reshape(self.steps, n_lights)
+                   if self.steps else np.zeros((0, n_lights), np.uint8))
+    self.cars = (np.memmap(path + ".cars", dtype = TRAJECTORY_DTYPE, mode = "r")
+                 if self.index[-1] else np.zeros(0, TRAJECTORY_DTYPE))
+    self.terrain_layer = np.load(path + ".terrain.npy")
+
+  # Número de steps grabados
+  def __len__(self):
+    return self.steps
+
+  # Columnas del step i, con el formato de CrossroadModel.report_columns
+  def columns(self, i):
+    records = self.cars[self.index[i]:self.index[i + 1]]
+    return ({name: records[name].astype(np.int64) for name, _ in FRAME_COLUMNS},
+            np.array(self.lights[i]))
+
+  # Cuadrícula del step i con los mismos códigos de get_grid
+  def grid(self, i):
+    grid = self.terrain_layer.copy()
+    records = self.cars[self.index[i]:self.index[i + 1]]
+    cells, counts = np.unique(records["y2"].astype(np.int64) * self.meta["m"] +
+                              records["x2"], return_counts = True)
+    grid.ravel()[cells] = np.where(counts == 1, 0, 1)
+    for light, state in zip(self.meta["lights"], self.lights[i].tolist()):
+      grid[light["y"], light["x"]] = LIGHT_CODES[LIGHT_STATES[state]]
+    return grid
+
+  # Recorre las cuadrículas de todos los steps grabados
+  def grids(self):
+    for i in range(self.steps):
+      yield self.grid(i)
+
+  # Step i con el formato de CrossroadModel.report_actions
+  def frame(self, i):
+    records = self.cars[self.index[i]:self.index[i + 1]].tolist()
+    cars = [{"id": id, "x1": x1, "y1": y1, "x2": x2, "y2": y2,
+             "origin": DIRECTIONS[origin], "action": ACTIONS[action],
+             "turn": TURNS[turn]}
+            for id, x1, y1, x2, y2, origin, action, turn in records]
+    lights = [{"id": light["id"], "state": LIGHT_STATES[state]}
+              for light, state in zip(self.meta["lights"], self.lights[i].tolist())]
+    return {"Items": cars}, {"Items": lights}